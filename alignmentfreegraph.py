@@ -1,7 +1,20 @@
 from dbmanager import DBManager
+from kmertools import canonical_kmer, encode_sequence, extract_kmers, kmer_codes, normalize_sequence, reverse_complement
+from shardedhashtable import ShardedHashtable
+from overlayhashtable import OverlayHashtable
+from resultcache import ResultCache
+from indexsnapshot import IndexSnapshot
+from fmindex import FMIndex
+from reachability import ReachabilityIndex
+from hyperloglog import HyperLogLog, mix64
+import numpy as np
 import pandas as pd
 import gfapy
+import asyncio
+import itertools
 import re
+import sys
+import threading
 
 
 class AlignmentFreeGraph(DBManager):
@@ -13,8 +26,17 @@ class AlignmentFreeGraph(DBManager):
     To do this, it work only with Direct Acyclic Graph (DAG) and it uses a k-mer based approach, where k is a parameter that can be set by the user.
     """
 
+    # number of sorted runs merged at a time when the hash-table is computed in external memory
+    MERGE_FAN_IN = 64
+    # estimated bytes of a k-mer record buffered by the driver, without the k-mer, when the hash-table is computed in external memory
+    RECORD_BYTES = 300
+    # number of ranges of start nodes for each worker when the hash-table is computed in parallel, more ranges balance better the work
+    RANGES_PER_WORKER = 4
+
     def __init__(self, location: str = None, db_name: str = None, username: str = None,
-                 password: str = None, configuration: [dict, str] = None, k: int = 3, check_acycle: bool = False):  # type: ignore
+                 password: str = None, configuration: [dict, str] = None, k: int = 3, check_acycle: bool = False,
+                 bloom_error_rate: float = None, canonical: bool = False, n_shards: int = None,
+                 cache_size: int = 1024, build_index: bool = True, workers: int = None):  # type: ignore
         """
         Alignment-Free Sequence to Graph constructor
 
@@ -30,15 +52,44 @@ class AlignmentFreeGraph(DBManager):
         :param password: The password of the database, default is None (type: str)
         :param configuration: The configuration of the database, default is None (type: dict or str)
         :param k: The k parameter, default is 3 (type: int)
-
-        :raises ValueError: If k is less than 1
+        :param bloom_error_rate: The false positive rate of the Bloom filter checked before a sharded hash-table in sequence_from_hash, default is None that means no filter (type: float)
+        :param canonical: If True the hash-table contains canonical k-mers, the smallest between a k-mer and its reverse complement, so the sequences are found on both strands, default is False (type: bool)
+        :param n_shards: The number of processes that build and serve the hash-table, default is None that means that the hash-table is a dictionary of this process (type: int)
+        :param cache_size: The number of results of sequence_from_hash and sequence_from_graph kept in cache, 0 disables the cache, default is 1024 (type: int)
+        :param build_index: If True the hash-table is computed by the constructor, otherwise it is empty until compute_hashtable or import_hashtable, default is True (type: bool)
+        :param workers: The number of threads that read the k-mers from the database when the hash-table is computed, default is None that means 1 (type: int)
+
+        :raises ValueError: If k is less than 1 or if workers is less than 1
         """
         self.check_acycle = check_acycle
+        self.canonical = canonical
+        self.n_shards = n_shards
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be greater than 0")
+        self.workers = workers
+        # the index is published as immutable snapshots, the writers hold the lock while they build and publish a new one
+        self._snapshot = IndexSnapshot({}, None, k, canonical)
+        self._writer_lock = threading.RLock()
+        # the version of the graph changes every time that the graph changes and the one of the index every time that a snapshot is published,
+        # the cached results are keyed on the version they depend on, so the ones of older versions are not used
+        self.graph_version = 0
+        self.index_version = 0
+        self.result_cache = ResultCache(cache_size)
+        self._topological_ranks = None
+        self._reachability = None
+        self._fm_index = None
+        self._paths = None
+        self._storage_mode = None
+        self._segments = None
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_queries = 0
+        self.bloom_rejected = 0
         super().__init__(location, db_name, username, password, configuration)
         if k < 1:
             raise ValueError("k must be greater than 1")
         self.k = k
-        self.compute_hashtable()
+        if build_index:
+            self.compute_hashtable()
 
     def connect(self, location: str = None, db_name: str = None,
                 username: str = None, password: str = None, configuration: [dict, str] = None):  # type: ignore
@@ -47,117 +98,666 @@ class AlignmentFreeGraph(DBManager):
 
         This method connect to the database with the given parameters.
         It also check if the graph is acyclic, if it is not, it raise a ValueError.
+        The graph can be another one, so the version of the graph changes and the cached results are cleared, the hash-table is kept until it is computed again.
 
         :return: True if the connection is successful
         """
-        if super().connect(location, db_name, username, password, configuration):
+        try:
+            connected = super().connect(location, db_name, username, password, configuration)
+        finally:
+            self.bump_version()
+            self.result_cache.clear()
+        if connected:
             if self.check_acycle:
                 if self.is_acyclic():
                     return True
                 else:
                     raise ValueError("Graph must be acyclic")
 
-    def compute_hashtable(self, k: int = None):
+    def compute_hashtable(self, k: int = None, progress=None, memory_budget: int = None, output_path: str = None, workers: int = None):
         """
         This method compute the hash-table of the graph.
 
         Every time that this method is called, the hash-table is re-initialize and re-computed.
         If the K parameter is valid and it is different from the current K parameter, the K attribute is update and the hash-table is re-computed with the new K parameter.
 
+        In canonical mode the k-mers are replaced by their canonical form, a k-mer and its reverse complement are the same k-mer also for the uniqueness, and the values of the hash-table have a third element, the strand of the graph k-mer ("+" if it is the canonical one, "-" otherwise).
+
+        If n_shards is set, the hash-table is a ShardedHashtable: the k-mers are split across n_shards processes, each one finds the unique k-mers of its shard.
+
+        If memory_budget is specified, the hash-table is computed in external memory: the k-mers are read in ranges of start nodes, one query for every range, and they are spilled to temporary files in sorted runs, that are merged to find the unique k-mers.
+        The driver keeps the whole result of a query in memory, so the ranges are chosen to take about half the budget and the runs take the other half.
+        If also output_path is specified, the unique k-mers are written in that file (see export_hashtable) and they are not kept in memory, the file can be loaded with import_hashtable.
+        The budget bounds the memory only with output_path, otherwise the unique k-mers are loaded in memory at the end, and only when the k-mers are read by matching chains of nodes, the paths of a compacted graph or of color sets are read whole.
+
+        If more workers are used, the start nodes are split in ranges of ids, the k-mers of every range are read and counted by a pool of threads and the counts are merged, so a k-mer is unique only if it starts in one node of the whole graph.
+        The workers are used only when the k-mers are read by matching chains of nodes, not from the paths of a compacted graph or of color sets, and not with memory_budget or n_shards.
+
+        The new hash-table is published as a new snapshot when it is complete, until then the readers keep using the previous one (see snapshot).
+
         :param k: The k parameter, default is None (type: int)
+        :param progress: Function called as progress(message, percent) while the hash-table is computed, default is None (type: callable)
+        :param memory_budget: The memory in bytes that can be used for the k-mers read from the graph, see above, default is None that means no limit (type: int)
+        :param output_path: The Parquet or Arrow file where the hash-table is written when memory_budget is specified, default is None (type: str)
+        :param workers: The number of threads that read the k-mers, default is None that means the workers of the graph (type: int)
 
-        :raises ValueError: If k is less than 1
+        :raises ValueError: If k is less than 1 or if workers is less than 1
 
         :return: The hash-table of the graph
         """
 
-        helper_dict = {}
+        if k is not None and k < 1:
+            raise ValueError("k must be greater than 0")
+        if workers is None:
+            workers = self.workers if self.workers is not None else 1
+        if workers < 1:
+            raise ValueError("workers must be greater than 0")
+
+        with self._writer_lock:
+            previous_k = self.k
+            if k is not None:
+                self.k = k
+
+            try:
+                if progress is not None:
+                    progress("Computing hash-table", None)
+
+                # a sharded hash-table of the previous snapshot is closed when the snapshot is freed
+                if memory_budget is not None:
+                    hashtable = self._compute_hashtable_external(
+                        memory_budget, output_path, progress)
+                elif self.n_shards is not None:
+                    hashtable = self._compute_hashtable_sharded(progress)
+                elif workers > 1 and not self._reads_paths():
+                    hashtable = self._compute_hashtable_parallel(
+                        workers, progress)
+                else:
+                    hashtable = self._compute_hashtable_memory(progress)
+            except BaseException:
+                # a build that fails or is cancelled by progress keeps the k of the current snapshot
+                self.k = previous_k
+                raise
+            self._publish(hashtable, self._bloom_filter_of(hashtable))
 
-        if k is not None:
-            if k < 1:
-                raise ValueError("k must be greater than 0")
-            self.k = k
+        return hashtable
 
-        query = "MATCH (a0)"
+    def _compute_hashtable_memory(self, progress=None):
+        """
+        This method compute the hash-table in memory, from the k-mers read from the graph.
 
-        for i in range(1, self.k):
-            query += f"-[r{i}]->(a{i})"
+        :return: The hash-table of the graph
+        """
+        return self._unique_kmers(self._count_kmers(self._kmer_records(progress)))
 
-        if self.k > 2:
-            query += f"\nWHERE"
-            for i in range(1, self.k-1):
-                query += f" type(r{i})=type(r{i+1}) AND "
-            query = query[:-5]
+    def _compute_hashtable_parallel(self, workers: int, progress=None):
+        """
+        This method compute the hash-table in memory, the k-mers of ranges of start nodes are read and counted by a pool of threads.
 
-        query += f"\nRETURN toInteger(a0.id) as ID, "
+        A node is in only one range, so the number of start nodes of a k-mer in the graph is the sum of the ones in the ranges.
 
-        for i in range(self.k):
-            query += f"a{i}.name + "
-        query = query[:-3]
+        :return: The hash-table of the graph
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        id_ranges = self._id_ranges(workers * self.RANGES_PER_WORKER)
+        counts = {}
+        with ThreadPoolExecutor(workers) as executor:
+            # the generators are consumed, so the queries are executed, in the threads of the pool
+            futures = [executor.submit(self._count_kmers, self._kmer_records(id_range=id_range))
+                       for id_range in id_ranges]
+            for n, future in enumerate(as_completed(futures)):
+                self._merge_kmer_counts(counts, future.result())
+                if progress is not None:
+                    progress(f"Computing hash-table ({n + 1}/{len(futures)} ranges)",
+                             int(100 * (n + 1) / len(futures)))
+
+        return self._unique_kmers(counts)
+
+    def _id_ranges(self, n_ranges: int):
+        """
+        This method split the ids of the nodes of the graph in ranges of the same size.
 
-        query += " as KMers"
+        :param n_ranges: The number of ranges (type: int)
 
-        if self.k > 1:
-            query += ", type(r1) as Color"
-            res = self.graph.run(query)
-            for r in res:
-                if r["ID"] not in helper_dict:
-                    helper_dict[r["ID"]] = {}
-                if r["KMers"] not in helper_dict[r["ID"]]:
-                    helper_dict[r["ID"]][r["KMers"]] = []
-                helper_dict[r["ID"]][r["KMers"]].append(r["Color"])
+        :return: The (low, high) ranges, low included and high excluded, empty if the graph is empty (type: list of tuples)
+        """
+        query = """
+        MATCH (n) WHERE n.id IS NOT NULL
+        RETURN min(toInteger(n.id)) AS low, max(toInteger(n.id)) AS high
+        """
+        res = self.query(query)
+        low, high = res[0]["low"], res[0]["high"]
+        if low is None:
+            return []
+        step = -(-(high - low + 1) // n_ranges)
+        return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+    @staticmethod
+    def _count_kmers(records):
+        """
+        This method count the start nodes of the k-mers read from the graph.
+
+        :param records: The (start node, k-mer, colors, strand) tuples (type: iterable)
+
+        :return: For every k-mer, a [start node, colors, strand, count] list, where the start node, the colors and the strand are the ones of the first node and the count is 1 if the k-mer starts only in that node and more otherwise (type: dict)
+        """
+        counts = {}
+        for node, kmer, colors, strand in records:
+            entry = counts.get(kmer)
+            if entry is None:
+                counts[kmer] = [node, list(colors), strand, 1]
+            elif entry[0] == node:
+                entry[1].extend(colors)
+            else:
+                entry[3] += 1
+        return counts
+
+    @staticmethod
+    def _merge_kmer_counts(counts: dict, other: dict):
+        """
+        This method add to counts the counts of the k-mers of other nodes, see _count_kmers.
+        """
+        for kmer, entry in other.items():
+            if kmer in counts:
+                counts[kmer][3] += entry[3]
+            else:
+                counts[kmer] = entry
+
+    def _unique_kmers(self, counts: dict):
+        """
+        This method compute the hash-table from the counts of the k-mers, see _count_kmers, only the k-mers that start in one node are kept.
+
+        :return: The hash-table of the graph
+        """
+        return {kmer: self._hashtable_value(node, colors, strand)
+                for kmer, (node, colors, strand, count) in counts.items() if count == 1}
+
+    def _kmer_records(self, progress=None, color: str = None, kmers: list = None, id_range: tuple = None, nodes: list = None):
+        """
+        This method read the k-mers of the graph from the database.
+
+        :param progress: Function called as progress(message, percent) while the k-mers are read, default is None (type: callable)
+        :param color: If specified, only the k-mers of this color are read, default is None (type: str)
+        :param kmers: If specified, only these k-mers are read, they are compared with the k-mers of the graph before the canonical form, default is None (type: list)
+        :param id_range: If specified, only the k-mers that start in a node with id in the (low, high) range, high excluded, are read, it is not used when the k-mers are read from the paths, default is None (type: tuple)
+        :param nodes: If specified, only the k-mers that start in a node with one of these ids are read, default is None (type: list)
+
+        :return: A generator of (start node, k-mer, colors, strand) tuples, in canonical mode the k-mers are canonical
+        """
+        low, high = id_range if id_range is not None else (None, None)
+        if self._reads_paths():
+            yield from self._path_kmer_records(progress, color, kmers, nodes)
+
+        elif self.k > 1:
+            query = "MATCH (a0)"
+
+            for i in range(1, self.k):
+                query += f"-[r{i}]->(a{i})"
+
+            if self.k > 2 or color is not None or id_range is not None or kmers is not None or nodes is not None:
+                query += f"\nWHERE"
+                for i in range(1, self.k-1):
+                    query += f" type(r{i})=type(r{i+1}) AND "
+                if color is not None:
+                    query += " type(r1)=$color AND "
+                if id_range is not None:
+                    query += " toInteger(a0.id) >= $low AND toInteger(a0.id) < $high AND "
+                if nodes is not None:
+                    query += " toInteger(a0.id) IN $nodes AND "
+                if kmers is not None:
+                    # filtered in the match, so the chains are not collected before the filter
+                    query += " " + " + ".join(f"a{i}.name" for i in range(self.k)) + " IN $kmers AND "
+                query = query[:-5]
+
+            query += f"\nWITH toInteger(a0.id) as ID, "
+
+            for i in range(self.k):
+                query += f"a{i}.name + "
+            query = query[:-3]
+
+            query += " as KMers, type(r1) as Color"
+            query += "\nRETURN ID, KMers, Color"
+
+            res = self.run(query, {"color": color, "kmers": kmers,
+                                   "low": low, "high": high, "nodes": nodes})
+            for n, r in enumerate(res):
+                if progress is not None and n % 10000 == 0:
+                    progress(f"Computing hash-table ({n} k-mers read)", None)
+                yield self._index_record(r["ID"], r["KMers"], [r["Color"]])
 
         else:
-            query = """
-            MATCH (n)
+            query = "MATCH (n)"
+            if color is not None:
+                query += f"\nWHERE (n)-[:{self._cypher_name(color)}]-()"
+            if kmers is not None:
+                query += " AND" if color is not None else "\nWHERE"
+                query += " n.name IN $kmers"
+            if id_range is not None:
+                query += " AND" if color is not None or kmers is not None else "\nWHERE"
+                query += " toInteger(n.id) >= $low AND toInteger(n.id) < $high"
+            if nodes is not None:
+                query += " AND" if color is not None or kmers is not None or id_range is not None else "\nWHERE"
+                query += " toInteger(n.id) IN $nodes"
+            query += """
             OPTIONAL MATCH (n)-[outgoing]->()
             OPTIONAL MATCH ()-[incoming]->(n)
             RETURN DISTINCT toInteger(n.id) as ID, n.name AS node, 
                 collect(DISTINCT type(outgoing)) + collect(DISTINCT type(incoming)) AS relations
             """
-            res = self.graph.run(query)
+            res = self.run(query, {"kmers": kmers, "low": low,
+                           "high": high, "nodes": nodes})
             for r in res:
-                if r["node"] not in helper_dict[r["ID"]]:
-                    helper_dict[r["ID"]][r["node"]] = []
-                helper_dict[r["ID"]][r["node"]] = list(set(r["relations"]))
-
-        kmer_counts = {}
-        # Count each k-mer
-        for node in helper_dict:
-            for kmer in helper_dict[node]:
-                if kmer not in kmer_counts:
-                    kmer_counts[kmer] = 1
-                else:
-                    kmer_counts[kmer] += 1
-
-        remove_kmers = []
-        # Find colors to remove
-        for node in helper_dict:
-            for kmer in helper_dict[node]:
-                if kmer_counts[kmer] > 1:
-                    remove_kmers.append((node, kmer))
-
-        # Remove colors
-        for el in remove_kmers:
-            helper_dict[el[0]].pop(el[1])
-
-        # compute the hashtable
-        self.hashtable = {}
-        for node in helper_dict:
-            for kmer in helper_dict[node]:
-                self.hashtable[kmer] = (node, helper_dict[node][kmer])
-
-        # compute the dataframe
-        rows = []
-        for key, value in helper_dict.items():
-            for kmer, colors in value.items():
-                rows.append({'start': key, 'Kmer': kmer, 'colors': colors})
+                yield self._index_record(r["ID"], r["node"], list(set(r["relations"])))
 
-        self.hashtable_df = pd.DataFrame(rows)
-        if len(self.hashtable_df) > 0:
-            self.hashtable_df.sort_values(by='start', inplace=True)
+    def _path_kmer_records(self, progress=None, color: str = None, kmers: list = None, nodes: list = None):
+        """
+        This method read the k-mers of the graph from its paths, so they are read also within and across the segments of a compacted graph.
 
-        return self.hashtable
+        The parameters and the records are the ones of _kmer_records, the start node of a k-mer is the id of its first base.
+        """
+        if kmers is not None:
+            kmers = set(kmers)
+        if nodes is not None:
+            nodes = set(nodes)
+        n = 0
+        for path_color, paths in self.path_sequences(progress).items():
+            if color is not None and path_color != color:
+                continue
+            for sequence, node_ids in paths:
+                for i in range(len(sequence) - self.k + 1):
+                    kmer = sequence[i:i + self.k]
+                    if kmers is not None and kmer not in kmers:
+                        continue
+                    if nodes is not None and int(node_ids[i]) not in nodes:
+                        continue
+                    if progress is not None and n % 10000 == 0:
+                        progress(
+                            f"Computing hash-table ({n} k-mers read)", None)
+                    n += 1
+                    yield self._index_record(int(node_ids[i]), kmer, [path_color])
+
+    def _storage(self):
+        # how the graph is stored, it is read again only when the version of the graph changes
+        if self._storage_mode is None or self._storage_mode[0] != self.graph_version:
+            query = """
+            OPTIONAL MATCH (s:segment) WITH s LIMIT 1
+            OPTIONAL MATCH (c:color_registry) WITH s, c LIMIT 1
+            RETURN s IS NOT NULL AS compacted, c.names AS colors
+            """
+            res = self.query(query)
+            self._storage_mode = (
+                self.graph_version, res[0]["compacted"], res[0]["colors"])
+        return self._storage_mode
+
+    def is_compacted(self):
+        """
+        This method check if the graph is compacted, that is if its nodes are segments instead of bases.
+
+        :return: True if the graph contains segment nodes (type: bool)
+        """
+        return self._storage()[1]
+
+    def color_names(self):
+        """
+        This method return the names of the colors of a graph stored with color sets, where every adjacency is a single LINK relationship with the ids of its colors.
+
+        :return: The name of every color id, None if the colors are the types of the relationships (type: list)
+        """
+        return self._storage()[2]
+
+    def _segment_bases(self):
+        # the segments of a compacted graph sorted by base_offset, they are read again only when the version of the graph changes
+        if self._segments is None or self._segments[0] != self.graph_version:
+            # a segment of one base has no inner bases and the same base_offset of the next segment, so it is only an id
+            query = """
+            MATCH (s:segment)
+            RETURN toInteger(s.id) AS ID, toInteger(s.base_offset) AS Offset, size(s.name) AS Length
+            """
+            rows = self.query(query)
+            ids = set(r["ID"] for r in rows)
+            rows = sorted((r for r in rows if r["Length"] > 1),
+                          key=lambda r: r["Offset"])
+            self._segments = (self.graph_version, ids,
+                              np.array([r["Offset"] for r in rows], dtype=np.int64),
+                              np.array([r["ID"] for r in rows], dtype=np.int64),
+                              np.array([r["Length"] for r in rows], dtype=np.int64))
+        return self._segments[1:]
+
+    def base_position(self, base: int):
+        """
+        This method return the node of the graph that contains a base and the offset of the base in the sequence of that node.
+
+        In a compacted graph the ids of the bases, that are the ones in the hash-table, are the ids that the bases would have as nodes: the first base of a segment has the id of the segment and the others follow its base_offset.
+        In a graph that is not compacted every base is a node, so the offset is 0.
+
+        :param base: The id of the base (type: int)
+
+        :raises KeyError: If the base is not in a segment of a compacted graph
+
+        :return: The id of the node and the offset of the base (type: tuple)
+        """
+        if not self.is_compacted():
+            return base, 0
+        ids, offsets, segments, lengths = self._segment_bases()
+        if base in ids:
+            return base, 0
+        i = int(np.searchsorted(offsets, base, side="right")) - 1
+        if i >= 0 and base < offsets[i] + lengths[i] - 1:
+            return int(segments[i]), int(base - offsets[i] + 1)
+        raise KeyError(base)
+
+    def _reads_paths(self):
+        # the k-mers of compacted graphs and of color sets are read from the paths, not by matching chains of nodes
+        return self.is_compacted() or self.color_names() is not None
+
+    def _index_record(self, node: int, kmer: str, colors: list):
+        if self.canonical:
+            kmer, strand = canonical_kmer(kmer)
+            return node, kmer, colors, strand
+        return node, kmer, colors, "+"
+
+    def _hashtable_value(self, node: int, colors: list, strand: str = None):
+        if self.canonical:
+            return node, colors, strand
+        return node, colors
+
+    def _compute_hashtable_sharded(self, progress=None):
+        """
+        This method compute the hash-table in the processes of a ShardedHashtable.
+
+        If the build stops, the hash-table is not published, so its processes are stopped here.
+
+        :return: The hash-table of the graph
+        """
+        hashtable = ShardedHashtable(self.n_shards, self.canonical)
+        try:
+            hashtable.add(self._kmer_records(progress))
+            hashtable.finalize()
+        except BaseException:
+            hashtable.close()
+            raise
+
+        return hashtable
+
+    @property
+    def hashtable(self):
+        """
+        The hash-table of the current snapshot.
+        """
+        return self._snapshot.hashtable
+
+    @property
+    def bloom_filter(self):
+        """
+        The Bloom filter of the current snapshot, None if there is no filter.
+        """
+        return self._snapshot.bloom_filter
+
+    @property
+    def hashtable_df(self):
+        """
+        The DataFrame of the current snapshot, None if it was not requested yet (see get_hashtable_df).
+        """
+        return self._snapshot.hashtable_df
+
+    def snapshot(self):
+        """
+        This method return the current snapshot of the index, a reader that uses only the snapshot sees the same hash-table also if it is computed again or updated at the same time.
+
+        :return: The current snapshot (type: IndexSnapshot)
+        """
+        return self._snapshot
+
+    def _publish(self, hashtable, bloom_filter=None):
+        """
+        This method publish a new snapshot of the index with the current k parameter and canonical mode, it must be called by a writer that holds the writer lock.
+
+        :return: The new snapshot (type: IndexSnapshot)
+        """
+        self.index_version += 1
+        self._snapshot = IndexSnapshot(
+            hashtable, bloom_filter, self.k, self.canonical, self.index_version)
+        return self._snapshot
+
+    def bump_version(self):
+        """
+        This method change the version of the graph, it must be called every time that the graph changes, so the results cached from the graph are not used anymore.
+
+        The results of the hash-table depend on the version of the index, that changes when a new snapshot is published.
+        """
+        self.graph_version += 1
+
+    def get_cache_stats(self):
+        """
+        This method return the statistics of the cache of the results of sequence_from_hash and sequence_from_graph.
+
+        :return: The number of hits, misses, evictions, results in the cache and the maximum number of results (type: dict)
+        """
+        return self.result_cache.stats()
+
+    def memory_usage(self, sample_size: int = 1000):
+        """
+        This method estimate the memory used by the indexes and the caches of the graph in this process.
+
+        The memory of the hash-table is estimated from a sample of its entries, the one of a sharded hash-table is in the processes of the shards and it is not counted.
+        The paths are the sequences of all the paths with the id of every base, they are kept after the hash-table of a compacted graph or of a graph with color sets is computed.
+
+        :param sample_size: The number of entries of the hash-table that are measured, default is 1000 (type: int)
+
+        :return: The estimated size of the hash-table, of its DataFrame, of the Bloom filter, of the reachability index, of the FM-index, of the paths, of the topological ranks, of the segments, of the result cache, and their total, in bytes (type: dict)
+        """
+        usage = {"hashtable": 0, "hashtable_df": 0, "bloom_filter": 0, "reachability": 0,
+                 "fm_index": 0, "paths": 0, "topological_ranks": 0, "segments": 0, "result_cache": 0}
+        snapshot = self._snapshot
+        hashtable = snapshot.hashtable
+        if not isinstance(hashtable, ShardedHashtable) and len(hashtable) > 0:
+            sample = itertools.islice(hashtable.items(), sample_size)
+            sampled = 0
+            size = 0
+            for kmer, value in sample:
+                sampled += 1
+                size += sys.getsizeof(kmer) + sys.getsizeof(value) + \
+                    sys.getsizeof(value[1])
+            usage["hashtable"] = sys.getsizeof(hashtable) + \
+                size * len(hashtable) // sampled
+        if snapshot.hashtable_df is not None:
+            usage["hashtable_df"] = int(
+                snapshot.hashtable_df.memory_usage(deep=True).sum())
+        if snapshot.bloom_filter is not None:
+            usage["bloom_filter"] = snapshot.bloom_filter.memory_usage()
+        if self._reachability is not None:
+            usage["reachability"] = self._reachability[1].memory_usage()
+        if self._fm_index is not None:
+            usage["fm_index"] = self._fm_index[1].memory_usage() + \
+                self._fm_index[2].nbytes + self._fm_index[3].nbytes
+        if self._paths is not None:
+            usage["paths"] = sum(sys.getsizeof(sequence) + node_ids.nbytes
+                                 for paths in self._paths[1].values() for sequence, node_ids in paths)
+        if self._topological_ranks is not None:
+            ranks = self._topological_ranks[1]
+            # a node id and a rank for every entry
+            usage["topological_ranks"] = sys.getsizeof(ranks) + \
+                2 * sys.getsizeof(2 ** 40) * len(ranks)
+        if self._segments is not None:
+            ids = self._segments[1]
+            usage["segments"] = sys.getsizeof(ids) + sys.getsizeof(2 ** 40) * len(ids) + \
+                sum(array.nbytes for array in self._segments[2:])
+        usage["result_cache"] = self.result_cache.memory_usage()
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def close_shards(self):
+        """
+        This method stop the processes of the hash-table, if it is a ShardedHashtable, and publish an empty snapshot.
+
+        The readers that still use the previous snapshot cannot search its hash-table anymore.
+        """
+        with self._writer_lock:
+            snapshot = self._snapshot
+            if isinstance(snapshot.hashtable, ShardedHashtable):
+                self._publish({})
+                snapshot.hashtable.close()
+
+    @staticmethod
+    def _lookup_kmers(hashtable, kmers: list):
+        """
+        This method search many k-mers in a hash-table, with a single request for each shard if the hash-table is sharded.
+
+        :return: The values of the k-mers, None for the k-mers that are not in the hash-table (type: list)
+        """
+        if isinstance(hashtable, ShardedHashtable):
+            return hashtable.get_many(kmers)
+        return [hashtable.get(kmer) for kmer in kmers]
+
+    def _compute_hashtable_external(self, memory_budget: int, output_path: str = None, progress=None):
+        """
+        This method compute the hash-table keeping in memory about memory_budget bytes of k-mers read from the graph.
+
+        The k-mers are read in ranges of start nodes that take half the budget (see _paged_kmer_records) and sorted in runs of the other half that are written in temporary files, then the runs are merged and the k-mers that start in only one node are kept.
+
+        :return: The hash-table of the graph, empty if output_path is specified
+        """
+        import heapq
+        import os
+        import tempfile
+
+        def read_run(path):
+            with open(path) as f:
+                for line in f:
+                    kmer, node, strand, *colors = line.rstrip(
+                        "\n").split("\t")
+                    yield kmer, int(node), strand, colors
+
+        def write_run(records):
+            path = os.path.join(run_dir, f"run{next(run_ids)}.tsv")
+            with open(path, "w") as f:
+                for kmer, node, strand, colors in records:
+                    f.write("\t".join([kmer, str(node), strand, *colors]) + "\n")
+            return path
+
+        run_ids = itertools.count()
+        with tempfile.TemporaryDirectory() as run_dir:
+            runs = []
+            merged = []
+            buffer = []
+            size = 0
+            for node, kmer, colors, strand in self._paged_kmer_records(memory_budget // 2, progress):
+                buffer.append((kmer, node, strand, colors))
+                size += sys.getsizeof(kmer) + \
+                    sum(sys.getsizeof(color) for color in colors) + 200
+                if size >= memory_budget // 2:
+                    buffer.sort()
+                    runs.append(write_run(buffer))
+                    buffer = []
+                    size = 0
+            buffer.sort()
+            runs.append(write_run(buffer))
+            buffer = []
+
+            # merge the runs a group at a time, to limit the number of open files
+            while len(runs) > self.MERGE_FAN_IN:
+                for i in range(0, len(runs), self.MERGE_FAN_IN):
+                    merged.append(write_run(heapq.merge(
+                        *[read_run(path) for path in runs[i:i + self.MERGE_FAN_IN]])))
+                runs, merged = merged, []
+
+            def unique_kmers():
+                records = heapq.merge(*[read_run(path) for path in runs])
+                for kmer, group in itertools.groupby(records, key=lambda record: record[0]):
+                    nodes = {}
+                    for _, node, strand, colors in group:
+                        nodes.setdefault(node, (strand, []))[1].extend(colors)
+                    if len(nodes) == 1:
+                        node, (strand, colors) = nodes.popitem()
+                        yield kmer, self._hashtable_value(node, colors, strand)
+
+            if progress is not None:
+                progress("Merging k-mers", None)
+            if output_path is not None:
+                self._write_hashtable_columnar(
+                    output_path, unique_kmers(), self.k, self.canonical)
+                hashtable = {}
+            else:
+                hashtable = dict(unique_kmers())
+
+        return hashtable
+
+    def _paged_kmer_records(self, page_budget: int, progress=None):
+        """
+        This method read the k-mers of the graph in ranges of start nodes, one query for every range, so that the records of a query take about page_budget bytes.
+
+        The number of ranges is estimated from the number of relationships, or of nodes if k is 1, the k-mers of compacted graphs and of color sets are read from the paths in a single pass.
+
+        :return: A generator of (start node, k-mer, colors, strand) tuples, see _kmer_records
+        """
+        if self._reads_paths():
+            yield from self._kmer_records(progress)
+            return
+
+        query = """
+        MATCH ()-[r]->() WITH count(r) AS relationships
+        MATCH (n) RETURN relationships, count(n) AS nodes
+        """
+        res = self.query(query)
+        records = res[0]["relationships"] if self.k > 1 else res[0]["nodes"]
+        page_size = max(1, page_budget // (self.RECORD_BYTES + self.k))
+        id_ranges = self._id_ranges(max(1, -(-records // page_size)))
+        for n, id_range in enumerate(id_ranges):
+            if progress is not None:
+                progress(f"Computing hash-table ({n + 1}/{len(id_ranges)} ranges)",
+                         int(100 * n / len(id_ranges)))
+            yield from self._kmer_records(id_range=id_range)
+
+    def compute_bloom_filter(self, error_rate: float = None):
+        """
+        This method compute the Bloom filter of the k-mers in the hash-table.
+
+        The filter is computed only for a sharded hash-table, where a lookup is a request to the processes of the shards, a lookup in a dictionary is faster than a test of the filter.
+
+        The filter is used by sequence_from_hash to reject a sequence, without looking in the hash-table, when one of its k-mers is surely not in the hash-table.
+        It is computed with the hash-table, the statistics of the filter are reset every time that it is computed.
+        The filter is published in a new snapshot with the hash-table of the current one.
+
+        :param error_rate: The false positive rate of the filter, default is None that means the current one (type: float)
+
+        :return: The Bloom filter, None if the error rate is None or if the hash-table is not sharded
+        """
+        with self._writer_lock:
+            if error_rate is not None:
+                self.bloom_error_rate = error_rate
+            hashtable = self._snapshot.hashtable
+            return self._publish(hashtable, self._bloom_filter_of(hashtable)).bloom_filter
+
+    def _bloom_filter_of(self, hashtable):
+        """
+        This method compute the Bloom filter of the k-mers of a hash-table and reset the statistics of the filter.
+
+        :return: The Bloom filter, None if the error rate is None or if the hash-table is not sharded
+        """
+        self.bloom_queries = 0
+        self.bloom_rejected = 0
+        if self.bloom_error_rate is None or not isinstance(hashtable, ShardedHashtable):
+            return None
+        # the filter is built in the processes of the shards
+        return hashtable.bloom_filter(self.bloom_error_rate)
+
+    def get_bloom_filter_stats(self):
+        """
+        This method return the statistics of the Bloom filter.
+
+        :return: The error rate, the number of k-mers, the memory in bytes, the number of queries, the number of rejected sequences and the rejection rate of the filter, None if there is no filter (type: dict)
+        """
+        bloom_filter = self._snapshot.bloom_filter
+        if bloom_filter is None:
+            return None
+        return {
+            "error_rate": bloom_filter.error_rate,
+            "kmers": len(bloom_filter),
+            "memory_bytes": bloom_filter.memory_usage(),
+            "queries": self.bloom_queries,
+            "rejected": self.bloom_rejected,
+            "rejection_rate": self.bloom_rejected / self.bloom_queries if self.bloom_queries > 0 else 0.0
+        }
 
     def get_k(self):
         return self.k
@@ -165,12 +765,13 @@ class AlignmentFreeGraph(DBManager):
     def get_hashtable(self):
         return self.hashtable
 
-    def set_k(self, k: int):
+    def set_k(self, k: int, progress=None):
         """
         This method set the K parameter of the graph.
-        When the K parameter is set, the hash-table is re-computed.
+        When the K parameter is set, the hash-table is re-computed, if the computation fails or it is cancelled the K parameter is not changed.
 
         :param k: The k parameter (type: int)
+        :param progress: Function called as progress(message, percent) while the hash-table is computed, default is None (type: callable)
 
         :raises ValueError: If k is None or if k is less than 1
         """
@@ -178,21 +779,95 @@ class AlignmentFreeGraph(DBManager):
             raise ValueError("k must be not None")
         if k < 1:
             raise ValueError("k must be greater than 0")
-        self.k = k
-        self.compute_hashtable()
+        self.compute_hashtable(k, progress=progress)
+
+    def estimate_k(self, k_values=None, target_uniqueness: float = 0.9, memory_budget: int = None,
+                   sample_rate: float = 0.1, precision: int = 12, progress=None):
+        """
+        This method estimate, without computing the hash-table, how many k-mers would be unique for every k, and choose the smallest k that is good enough.
+
+        The colored paths of the graph are read once, then for every k a sample of the k-mers, chosen by their hash so that all the occurrences of a sampled k-mer are kept, is added to two HyperLogLog sketches: one of the distinct k-mers and one of the distinct (start node, k-mer) pairs.
+        A k-mer that is not unique starts in at least two nodes, so the unique k-mers are at least 2 * k-mers - pairs, this lower bound is used as the estimate.
+        Only the k-mers of bases (A, C, G, T) are counted.
+
+        :param k_values: The values of k to estimate, at most 32, default is None that means from 1 to 32 (type: iterable of int)
+        :param target_uniqueness: The minimum fraction of distinct k-mers that must be unique, default is 0.9 (type: float)
+        :param memory_budget: The maximum memory in bytes of the hash-table, default is None that means no limit (type: int)
+        :param sample_rate: The fraction of the distinct k-mers that are sampled, default is 0.1 (type: float)
+        :param precision: The precision of the sketches, see HyperLogLog, default is 12 (type: int)
+        :param progress: Function called as progress(message, percent) for every k, default is None (type: callable)
+
+        :raises ValueError: If sample_rate is not between 0 and 1 or if a k is not between 1 and 32
+
+        :return: The smallest k that meets the target uniqueness and the memory budget, None if there is no such k, and the estimated k-mers, unique k-mers, uniqueness and memory for every k (type: dict)
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        if k_values is None:
+            k_values = range(1, 33)
+        k_values = list(k_values)
+        if any(k < 1 or k > 32 for k in k_values):
+            raise ValueError("k must be between 1 and 32")
+
+        threshold = np.uint64(min(int(sample_rate * 2 ** 64), 2 ** 64 - 1))
+        paths = [(encode_sequence(sequence)[1], node_ids)
+                 for paths in self.path_sequences(progress).values()
+                 for sequence, node_ids in paths]
+
+        estimates = []
+        best = None
+        for n, k in enumerate(k_values):
+            if progress is not None:
+                progress(f"Estimating k = {k}", int(100 * n / len(k_values)))
+            kmers_sketch = HyperLogLog(precision)
+            pairs_sketch = HyperLogLog(precision)
+            records = 0
+            for codes, node_ids in paths:
+                kmers, mask = kmer_codes(codes, k)
+                if len(kmers) == 0:
+                    continue
+                if self.canonical:
+                    reverse, _ = kmer_codes(
+                        np.where(codes > 3, codes, 3 - codes)[::-1], k)
+                    kmers = np.minimum(kmers, reverse[::-1])
+                hashes = mix64(kmers)
+                # the sample depends only on the k-mer, with a hash independent of the one of the sketches
+                sampled = mask & (mix64(hashes) < threshold)
+                kmers_sketch.add_hashes(hashes[sampled])
+                pairs_sketch.add_hashes(
+                    mix64(hashes[sampled] ^ mix64(node_ids[:len(kmers)][sampled])))
+                records += int(np.count_nonzero(sampled))
+
+            n_kmers = kmers_sketch.count() / sample_rate
+            n_pairs = pairs_sketch.count() / sample_rate
+            unique = min(max(0.0, 2 * n_kmers - n_pairs), n_kmers)
+            uniqueness = unique / n_kmers if n_kmers > 0 else 0.0
+            colors = records / sample_rate / n_pairs if n_pairs > 0 else 0.0
+            # k-mer, value and colors of an entry, plus about 40 bytes of the slot in the dictionary
+            value = (0, [], "+") if self.canonical else (0, [])
+            entry = sys.getsizeof("A" * k) + sys.getsizeof(value) + \
+                sys.getsizeof([]) + 8 * colors + 40
+            memory = int(unique * entry)
+            estimates.append({"k": k, "kmers": int(n_kmers), "unique": int(unique),
+                              "uniqueness": uniqueness, "memory_bytes": memory})
+            if best is None and uniqueness >= target_uniqueness and (memory_budget is None or memory <= memory_budget):
+                best = k
+
+        return {"k": best, "estimates": estimates}
 
     def sequence_from_hash(self, sequence: str = None, k: int = None):
         """
         This method compute the sequence from the hash-table of the graph.
 
         This function divide the sequence in k-mers and then it search the k-mers in the hash-table.
+        A sequence with characters that are not bases (A, C, G, T) is never found.
 
         :param sequence: The sequence to compute, default is None (type: str)
         :param k: The k parameter, default is None (type: int)
 
         :raises ValueError: If sequence is None
 
-        :return: The vertex in the graph that represent the sequence if the sequence is in the graph (type: tuple)
+        :return: The vertex in the graph that represent the sequence if the sequence is in the graph, in canonical mode a (vertex, orientation) pair for every k-mer, where the orientation is "+" if the k-mer is on the strand of the graph and "-" if it is on the opposite strand (type: tuple)
         """
 
         if sequence is None:
@@ -200,32 +875,170 @@ class AlignmentFreeGraph(DBManager):
         if k is not None and k != self.k:
             self.compute_hashtable(k)
 
-        sequence = sequence.upper()
-        sequence = sequence.replace(" ", "")
-        if len(sequence) < self.k:
+        sequence = normalize_sequence(sequence)
+
+        # the whole search uses the same snapshot, also if a new one is published meanwhile
+        snapshot = self._snapshot
+        key = ("hash", sequence, snapshot.k, snapshot.version)
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self._sequence_from_hash(sequence, snapshot)
+            self.result_cache.put(key, result)
+        return result
+
+    def _sequence_from_hash(self, sequence: str, snapshot: IndexSnapshot):
+        k = snapshot.k
+        if len(sequence) < k:
             return ()
 
-        chunks = [sequence[i:i+self.k]
-                  for i in range(0, len(sequence), self.k) if len(sequence[i:i+self.k]) == self.k]
+        chunks, mask, strands = extract_kmers(
+            sequence, k, k, snapshot.canonical)
         save = {}
 
-        for i, chunk in enumerate(chunks):
-            if chunk in self.hashtable:
-                save[i*self.k+(int(i == 0))] = self.hashtable[chunk][0]
+        # the hash-table contains only k-mers of bases
+        if not all(mask):
+            return ()
+
+        if snapshot.bloom_filter is not None:
+            self.bloom_queries += 1
+            for chunk in chunks:
+                if chunk not in snapshot.bloom_filter:
+                    self.bloom_rejected += 1
+                    return ()
+
+        values = self._lookup_kmers(snapshot.hashtable, chunks)
+        for i, value in enumerate(values):
+            if value is not None:
+                save[i*k+(int(i == 0))] = value[0]
+                if snapshot.canonical:
+                    save[i*k+(int(i == 0))] = (value[0],
+                                                    "+" if strands[i] == value[2] else "-")
             else:
                 return ()
 
-        res = set(self.hashtable[chunks[0]][1])
-        for i in range(1, len(chunks)):
+        res = set(values[0][1])
+        for i in range(1, len(values)):
             res = res.intersection(
-                set(self.hashtable[chunks[i]][1]))
+                set(values[i][1]))
 
         if len(res) == 0:
             return tuple(save.values())
         else:
             return ()
 
-    def sequence_from_graph(self, sequence: str = None, k: int = None):
+    def sequence_from_chain(self, sequence: str = None, k: int = None):
+        """
+        This method compute the sequence from the hash-table of the graph with a seed-and-chain approach, so it works also for long sequences with errors.
+
+        Every k-mer of the sequence, also the overlapping ones, is searched in the hash-table and each hit is a seed, the k-mers with characters that are not bases are skipped.
+        The seeds are chained if they are in the same order in the sequence and in a topological order of the graph, the longest chain is found in O(n log n) time.
+        In a compacted graph the position of a seed is the position of its segment and then the offset of its base in the segment (see base_position).
+        In canonical mode the seeds on the opposite strand are chained in the reverse topological order.
+
+        :param sequence: The sequence to compute, default is None (type: str)
+        :param k: The k parameter, default is None (type: int)
+
+        :raises ValueError: If sequence is None
+
+        :return: The vertices of the best chain, its score (the number of seeds), the span of the sequence covered (start, end), the colors shared by all the seeds and the orientation of the chain, None if no k-mer is in the hash-table (type: dict)
+        """
+
+        if sequence is None:
+            raise ValueError("sequence must be not None")
+        if k is not None and k != self.k:
+            self.compute_hashtable(k)
+
+        sequence = normalize_sequence(sequence)
+
+        snapshot = self._snapshot
+        kmers, mask, strands = extract_kmers(
+            sequence, snapshot.k, 1, snapshot.canonical)
+        positions = [i for i, valid in enumerate(mask) if valid]
+
+        ranks = self.topological_ranks()
+        seeds = {"+": [], "-": []}
+        for i, value in zip(positions, self._lookup_kmers(snapshot.hashtable, [kmers[i] for i in positions])):
+            if value is None:
+                continue
+            try:
+                node, offset = self.base_position(value[0])
+            except KeyError:
+                continue
+            if node in ranks:
+                orientation = "+"
+                if snapshot.canonical and strands[i] != value[2]:
+                    orientation = "-"
+                seeds[orientation].append((i, (ranks[node], offset), value))
+
+        best = None
+        for orientation, orientation_seeds in seeds.items():
+            if orientation == "-":
+                orientation_seeds = [(i, (-rank, -offset), value)
+                                     for i, (rank, offset), value in orientation_seeds]
+            chain = self._best_chain(orientation_seeds)
+            if len(chain) > 0 and (best is None or len(chain) > best["score"]):
+                colors = set(chain[0][2][1])
+                for seed in chain[1:]:
+                    colors = colors.intersection(seed[2][1])
+                best = {
+                    "nodes": tuple(seed[2][0] for seed in chain),
+                    "score": len(chain),
+                    "span": (chain[0][0], chain[-1][0] + snapshot.k),
+                    "colors": sorted(colors),
+                    "orientation": orientation
+                }
+        return best
+
+    @staticmethod
+    def _best_chain(seeds: list):
+        """
+        This method find the longest chain of seeds increasing both in the sequence position and in the graph position.
+
+        A Fenwick tree over the graph positions keeps the best chain ending before every position, the seeds with the same sequence position are never chained together.
+
+        :param seeds: The (sequence position, graph position, value) tuples (type: list)
+
+        :return: The seeds of the chain, in order (type: list)
+        """
+        if len(seeds) == 0:
+            return []
+
+        seeds = sorted(seeds, key=lambda seed: (seed[0], seed[1]))
+        positions = {rank: i for i, rank in enumerate(
+            sorted(set(seed[1] for seed in seeds)))}
+        tree = [(0, -1)] * (len(positions) + 1)
+        scores = [(0, -1)] * len(seeds)
+        previous = [-1] * len(seeds)
+
+        i = 0
+        while i < len(seeds):
+            j = i
+            while j < len(seeds) and seeds[j][0] == seeds[i][0]:
+                j += 1
+            for s in range(i, j):
+                # best chain that ends before the graph position of the seed
+                best = (0, -1)
+                t = positions[seeds[s][1]]
+                while t > 0:
+                    best = max(best, tree[t])
+                    t -= t & -t
+                scores[s] = (best[0] + 1, s)
+                previous[s] = best[1]
+            for s in range(i, j):
+                t = positions[seeds[s][1]] + 1
+                while t < len(tree):
+                    tree[t] = max(tree[t], scores[s])
+                    t += t & -t
+            i = j
+
+        s = max(scores)[1]
+        chain = []
+        while s != -1:
+            chain.append(seeds[s])
+            s = previous[s]
+        return chain[::-1]
+
+    def sequence_from_graph(self, sequence: str = None, k: int = None, progress=None):
         """
         This method compute the sequence from the graph.
 
@@ -233,6 +1046,7 @@ class AlignmentFreeGraph(DBManager):
 
         :param sequence: The sequence to compute, default is None (type: str)
         :param k: The k parameter, default is None (type: int)
+        :param progress: Function called as progress(message, percent) after every k-mer searched, default is None (type: callable)
 
         :raises ValueError: If sequence is None
 
@@ -242,53 +1056,333 @@ class AlignmentFreeGraph(DBManager):
         if sequence is None:
             raise ValueError("sequence must be not None")
         if k is not None and k != self.k:
-            self.compute_hashtable(k)
+            self.compute_hashtable(k, progress=progress)
+
+        sequence = normalize_sequence(sequence)
 
-        sequence = sequence.upper()
-        sequence = sequence.replace(" ", "")
+        key = ("graph", sequence, self.k, self.graph_version)
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self._sequence_from_graph(sequence, progress)
+            self.result_cache.put(key, result)
+        return result
+
+    def _sequence_from_graph(self, sequence: str, progress=None):
         if len(sequence) < self.k:
             return ()
 
-        chunks = [sequence[i:i+self.k]
-                  for i in range(0, len(sequence), self.k) if len(sequence[i:i+self.k]) == self.k]
+        chunks = extract_kmers(sequence, self.k, self.k)[0]
         save = {}
 
+        if self._reads_paths():
+            # the k-mers can cross the segments, so they are searched in the paths
+            paths = [path for paths in self.path_sequences(progress).values()
+                     for path in paths]
+            for i, chuck in enumerate(chunks):
+                for path_sequence, node_ids in paths:
+                    position = path_sequence.find(chuck)
+                    if position >= 0:
+                        save[i*self.k+(int(i == 0))] = int(node_ids[position])
+                        break
+            return tuple(save.values())
+
         for i, chuck in enumerate(chunks):
-            query = f"MATCH (a0:base {{ name:\"{chuck[0]}\"}})"
-            for j in range(1, self.k):
-                query += f"-[r{j}]->(a{j}:base {{ name:\"{chuck[j]}\"}})"
-            query += f"\nWHERE "
-            for j in range(1, self.k-1):
-                query += f"type(r{j})=type(r{j+1}) AND "
-            query = query[:-5]
-            query += f"\nRETURN toInteger(a0.id) as ID"
-
-            res = self.graph.run(query)
+            if progress is not None:
+                progress(f"Searching k-mer {i + 1}/{len(chunks)}",
+                         int(100 * i / len(chunks)))
+            res = self.run(self._kmer_query(chuck))
             for r in res:
                 if (i*self.k+(int(i == 0))) not in save:
                     save[i*self.k+(int(i == 0))] = r["ID"]
 
         return tuple(save.values())
 
-    def upload_from_json(self, file_path: str, direction: int = 1):
-        super().upload_from_json(file_path, direction)
-        self.compute_hashtable()
+    def _kmer_query(self, kmer: str):
+        """
+        This method return the query that search the start nodes of a k-mer in the graph.
+        """
+        query = f"MATCH (a0:base {{ name:\"{kmer[0]}\"}})"
+        for j in range(1, self.k):
+            query += f"-[r{j}]->(a{j}:base {{ name:\"{kmer[j]}\"}})"
+        query += f"\nWHERE "
+        for j in range(1, self.k-1):
+            query += f"type(r{j})=type(r{j+1}) AND "
+        query = query[:-5]
+        query += f"\nRETURN toInteger(a0.id) as ID"
+        return query
+
+    async def async_sequence_from_graph(self, sequence: str = None, k: int = None, max_concurrency: int = 8):
+        """
+        This method compute the sequence from the graph as sequence_from_graph, but the k-mers are searched concurrently.
 
-    def upload_from_gfa(self, file_path: str):
+        :param sequence: The sequence to compute, default is None (type: str)
+        :param k: The k parameter, default is None (type: int)
+        :param max_concurrency: Maximum number of k-mers searched at the same time, default is 8 (type: int)
+
+        :raises ValueError: If sequence is None
+
+        :return: The vertex in the graph that represent the sequence if the sequence is in the graph (type: tuple)
+        """
+
+        if sequence is None:
+            raise ValueError("sequence must be not None")
+        # the hash-table and the paths are computed in a thread, so the event loop is not blocked
+        if k is not None and k != self.k:
+            await asyncio.to_thread(self.compute_hashtable, k)
+
+        sequence = normalize_sequence(sequence)
+
+        # the results are shared with sequence_from_graph
+        key = ("graph", sequence, self.k, self.graph_version)
+        result = self.result_cache.get(key)
+        if result is not None:
+            return result
+
+        result = ()
+        if await asyncio.to_thread(self._reads_paths):
+            result = await asyncio.to_thread(self._sequence_from_graph, sequence)
+        elif len(sequence) >= self.k:
+            chunks = extract_kmers(sequence, self.k, self.k)[0]
+            results = await self.async_query_many([self._kmer_query(chuck) for chuck in chunks],
+                                                  max_concurrency)
+            save = {}
+            for i, res in enumerate(results):
+                if len(res) > 0:
+                    save[i*self.k+(int(i == 0))] = res[0]["ID"]
+            result = tuple(save.values())
+        self.result_cache.put(key, result)
+        return result
+
+    def path_sequences(self, progress=None):
+        """
+        This method materialize the paths of the graph, every color is followed from the nodes without incoming relationships of that color.
+
+        If a color has more relationships out of a node, the path continues with the node with the smallest id and a new path starts from the others.
+        The segments of a compacted graph are read in the orientation of the relationships, and every base is mapped to the id that it would have as a node.
+        If the graph is stored with color sets, every LINK relationship belongs to all its colors.
+        The paths of a single segment, that have no relationships, are read from the paths property of their segment.
+        The paths are computed again only when the version of the graph changes.
+
+        :param progress: Function called as progress(message, percent) while the paths are read, default is None (type: callable)
+
+        :return: For every color, the list of its paths as (sequence, node ids) pairs, with the id of the node of every character of the sequence (type: dict)
+        """
+        if self._paths is not None and self._paths[0] == self.graph_version:
+            return self._paths[1]
+
+        if progress is not None:
+            progress("Reading the paths", None)
+        color_names = self.color_names()
+        if color_names is None:
+            query = "MATCH (a)-[r]->(b)\nWITH a, r, b, type(r) AS Color"
+        else:
+            query = "MATCH (a)-[r:LINK]->(b)\nUNWIND r.colors AS Color"
+        query += """
+        RETURN Color, toInteger(a.id) AS From, a.name AS FromName,
+            toInteger(a.base_offset) AS FromOffset, r.from_strand AS FromStrand,
+            toInteger(b.id) AS To, b.name AS ToName,
+            toInteger(b.base_offset) AS ToOffset, r.to_strand AS ToStrand
+        """
+        successors = {}
+        names = {}
+        offsets = {}
+        strands = {}
+        for r in self.run(query):
+            color = r["Color"] if color_names is None else color_names[r["Color"]]
+            successors.setdefault(color, {}).setdefault(
+                r["From"], []).append(r["To"])
+            names[r["From"]] = r["FromName"]
+            names[r["To"]] = r["ToName"]
+            offsets[r["From"]] = r["FromOffset"]
+            offsets[r["To"]] = r["ToOffset"]
+            # a segment is read in the same orientation by all the relationships of a path
+            strands[(color, r["From"])] = r["FromStrand"] or "+"
+            strands[(color, r["To"])] = r["ToStrand"] or "+"
+
+        def read(node, name, offset, strand):
+            # the first base of a segment has the id of the segment, the others follow its offset
+            ids = np.full(len(name), node, dtype=np.int64)
+            if offset is not None:
+                ids[1:] = np.arange(offset, offset + len(name) - 1)
+            if strand == "-":
+                return name[::-1], ids[::-1]
+            return name, ids
+
+        paths = {}
+        for color, color_successors in successors.items():
+            targets = set(node for nodes in color_successors.values()
+                          for node in nodes)
+            nodes = sorted(set(color_successors) | targets)
+            # the nodes of cycles are visited after the sources
+            starts = [node for node in nodes if node not in targets] + nodes
+            visited = set()
+            paths[color] = []
+            for start in starts:
+                if start in visited:
+                    continue
+                stack = [start]
+                while len(stack) > 0:
+                    node = stack.pop()
+                    if node in visited:
+                        continue
+                    sequence = []
+                    node_ids = []
+                    while node is not None and node not in visited:
+                        visited.add(node)
+                        name, ids = read(node, names[node], offsets[node],
+                                         strands[(color, node)])
+                        sequence.append(name)
+                        node_ids.append(ids)
+                        next_nodes = sorted(color_successors.get(node, []))
+                        stack.extend(reversed(next_nodes[1:]))
+                        node = next_nodes[0] if len(next_nodes) > 0 else None
+                    paths[color].append(("".join(sequence), np.concatenate(node_ids)))
+
+        if self.is_compacted():
+            query = """
+            MATCH (s:segment) WHERE s.paths IS NOT NULL
+            RETURN toInteger(s.id) AS ID, s.name AS Name, toInteger(s.base_offset) AS Offset,
+                s.paths AS Colors, s.path_strands AS Strands
+            """
+            for r in self.run(query):
+                for color, strand in zip(r["Colors"], r["Strands"]):
+                    color = color if color_names is None else color_names[color]
+                    paths.setdefault(color, []).append(
+                        read(r["ID"], r["Name"], r["Offset"], strand))
+
+        self._paths = (self.graph_version, paths)
+        return paths
+
+    def build_fm_index(self, sa_rate: int = 32, progress=None):
+        """
+        This method build the FM-index of the paths of the graph, used by sequence_from_fm.
+
+        :param sa_rate: Every how many positions of the paths the suffix array is sampled, default is 32 (type: int)
+        :param progress: Function called as progress(message, percent) while the index is built, default is None (type: callable)
+
+        :return: The FM-index of the paths (type: FMIndex)
+        """
+        colors = []
+        sequences = []
+        node_ids = []
+        for color, paths in self.path_sequences(progress).items():
+            for sequence, ids in paths:
+                colors.append(color)
+                sequences.append(sequence)
+                node_ids.append(ids)
+                # the separator after every path has no node
+                node_ids.append([-1])
+
+        if progress is not None:
+            progress("Building the FM-index", None)
+        index = FMIndex(sequences, sa_rate)
+        self._fm_index = (self.graph_version, index, np.array(colors, dtype=str),
+                          np.concatenate(node_ids).astype(np.int64) if len(node_ids) > 0 else np.zeros(0, dtype=np.int64))
+        return index
+
+    def save_fm_index(self, file_path: str):
+        """
+        This method save the FM-index of the paths in a compressed NumPy file, it is built if needed.
+
+        :param file_path: Path of the file
+        """
+        if self._fm_index is None or self._fm_index[0] != self.graph_version:
+            self.build_fm_index()
+        _, index, colors, node_ids = self._fm_index
+        index.save(file_path, colors=colors, node_ids=node_ids)
+
+    def load_fm_index(self, file_path: str):
+        """
+        This method load an FM-index saved with save_fm_index, it must be of the current graph.
+
+        :param file_path: Path of the file
+
+        :return: The FM-index of the paths (type: FMIndex)
+        """
+        index, arrays = FMIndex.load(file_path)
+        self._fm_index = (self.graph_version, index,
+                          arrays["colors"], arrays["node_ids"])
+        return index
+
+    def sequence_from_fm(self, sequence: str = None, progress=None):
+        """
+        This method search a sequence of any length in the paths of the graph with the FM-index, it is built if the graph is changed.
+
+        The time of the search is proportional to the length of the sequence plus the number of matches.
+
+        :param sequence: The sequence to search, default is None (type: str)
+        :param progress: Function called as progress(message, percent) while the index is built, default is None (type: callable)
+
+        :raises ValueError: If sequence is None
+
+        :return: The (color, first node, last node) of every match of the sequence in the paths of the graph (type: tuple)
+        """
+        if sequence is None:
+            raise ValueError("sequence must be not None")
+
+        sequence = normalize_sequence(sequence)
+
+        if self._fm_index is None or self._fm_index[0] != self.graph_version:
+            self.build_fm_index(progress=progress)
+
+        key = ("fm", sequence, self.graph_version)
+        result = self.result_cache.get(key)
+        if result is None:
+            _, index, colors, node_ids = self._fm_index
+            result = []
+            for path, offset in index.locate(sequence):
+                start = int(index.starts[path]) + offset
+                result.append((str(colors[path]), int(node_ids[start]),
+                               int(node_ids[start + len(sequence) - 1])))
+            result = tuple(result)
+            self.result_cache.put(key, result)
+        return result
+
+    def upload_from_json(self, file_path: str, direction: int = 1, progress=None):
+        if progress is not None:
+            progress("Uploading " + file_path, None)
+        try:
+            super().upload_from_json(file_path, direction)
+        finally:
+            self.bump_version()
+        self.compute_hashtable(progress=progress)
+
+    def upload_from_gfa(self, file_path: str, progress=None, compacted: bool = False, color_sets: bool = False):
         """
         This method uploads a graph from a GFA file.
 
         :param file_path: Path of the file
+        :param progress: Function called as progress(message, percent) during the upload, default is None, in this case the progress is printed (type: callable)
+        :param compacted: If True every segment is a single node with its whole sequence, instead of a node for every base, default is False (type: bool)
+        :param color_sets: If True every adjacency is a single LINK relationship with the ids of the paths that traverse it, and also the links (L lines) are uploaded, instead of a relationship for every path typed with its name, default is False (type: bool)
 
-        :raises ValueError: If the file is not in the correct format
+        :raises ValueError: If the file is not in the correct format or if the graph is not acyclic
         """
 
         self.gfa = gfapy.Gfa.from_file
         self.gfa = self.gfa(file_path)
 
+        # the version changes also if the upload stops part-way, so the caches of the old graph are not used
+        try:
+            if compacted:
+                self._upload_compacted_gfa(progress, color_sets)
+            else:
+                self._upload_base_gfa(progress, color_sets)
+        finally:
+            self.bump_version()
+        self.compute_hashtable(progress=progress)
+
+    def _upload_base_gfa(self, progress=None, color_sets: bool = False):
+        """
+        This method uploads the GFA file in self.gfa with a node for every base, and the relationships of the paths between the bases.
+        """
         nodes = {}
         i = len(self.gfa.segments) + 1
-        for line in self.gfa.segments:
+        n_segments = len(self.gfa.segments)
+        for sg, line in enumerate(self.gfa.segments):
+            if progress is not None:
+                progress(f"Segment {sg + 1}/{n_segments}",
+                         int(100 * sg / n_segments))
             seq_id = int(line.name)
             if seq_id not in nodes:
                 nodes[seq_id] = []
@@ -308,25 +1402,20 @@ class AlignmentFreeGraph(DBManager):
                     'label': 'base'
                 })
 
-        if self.gfa.paths:
+        if color_sets:
+            self._upload_color_sets("base", self._color_set_edges(nodes), progress)
+
+        elif self.gfa.paths:
             n_paths = len(self.gfa.paths)
             pt = 0
             for path in self.gfa.paths:
-                print()
+                if progress is None:
+                    print()
                 pt += 1
                 trail = []
                 for seg in path.segment_names:
-                    num = ""
-                    direction = ""
-                    for chr in str(seg):
-                        if chr.isdigit():
-                            num += chr
-                        else:
-                            direction = chr
-                    num = int(num)
-                    if direction not in ["+", "-"]:
-                        raise ValueError("wrong direction")
-                    elif direction == "+":
+                    num, direction = self._oriented_segment(seg)
+                    if direction == "+":
                         for el in nodes[num]:
                             trail.append(el[1])
                     else:
@@ -346,26 +1435,471 @@ class AlignmentFreeGraph(DBManager):
                         up_char = "\\"
                     if (i / (len_trail / 100)) > perc:
                         perc += 1
-                    print(
-                        f"\rPath {pt}/{n_paths} ({len_trail} relations) {up_char} {perc}%", end="")
+                    if progress is not None:
+                        progress(
+                            f"Path {pt}/{n_paths} ({len_trail} relations)", perc)
+                    else:
+                        print(
+                            f"\rPath {pt}/{n_paths} ({len_trail} relations) {up_char} {perc}%", end="")
                     from_prop = {"id": trail[i]}
                     to_prop = {"id": trail[i+1]}
                     self.relation_upload(
                         from_label="base", from_prop=from_prop, to_label="base", to_prop=to_prop, label=re.sub(r'[|:-]', '', path.name), update=False)
 
-        self.compute_hashtable()
+    @staticmethod
+    def _oriented_segment(seg):
+        """
+        This method read the id and the direction of a segment of a GFA path.
+
+        :raises ValueError: If the direction is not + or -
+
+        :return: The id of the segment and its direction (type: tuple)
+        """
+        num = ""
+        direction = ""
+        for chr in str(seg):
+            if chr.isdigit():
+                num += chr
+            else:
+                direction = chr
+        if direction not in ["+", "-"]:
+            raise ValueError("wrong direction")
+        return int(num), direction
+
+    def _upload_compacted_gfa(self, progress=None, color_sets: bool = False, batch_size: int = 1000):
+        """
+        This method uploads the GFA file in self.gfa as a compacted graph, with a segment node for every segment and the relationships of the paths between the segments.
+
+        A segment node has the id of its first base, its sequence as name and the base_offset, that is the id of its second base, because the ids of the bases of a segment are consecutive as in upload_from_gfa.
+        The relationships keep the direction of the two segments in the path, with color_sets there is a LINK relationship for every adjacency as in _upload_color_sets.
+        A path of a single segment has no relationships, so its color and its strand are added to the paths and path_strands properties of the segment.
+        The relationships are uploaded in batches, so the graph is checked once at the end, as in _rollback_if_cyclic.
+
+        :raises ValueError: If the graph is not acyclic, the relationships of the paths are removed
+        """
+        self.query(
+            "CREATE INDEX IF NOT EXISTS FOR (s:segment) ON (s.id)")
+
+        segments = []
+        i = len(self.gfa.segments) + 1
+        for line in self.gfa.segments:
+            segments.append({'id': int(line.name), 'name': line.sequence,
+                             'base_offset': i})
+            i += len(line.sequence) - 1
+        for sg in range(0, len(segments), batch_size):
+            if progress is not None:
+                progress(f"Segment {sg + 1}/{len(segments)}",
+                         int(100 * sg / len(segments)))
+            self.query("UNWIND $segments AS s CREATE (:segment {id: s.id, name: s.name, base_offset: s.base_offset})",
+                       {"segments": segments[sg:sg + batch_size]})
+
+        singles = [(re.sub(r'[|:-]', '', path.name), self._oriented_segment(path.segment_names[0]))
+                   for path in self.gfa.paths if len(path.segment_names) == 1]
+        if len(singles) > 0:
+            colors = [name for name, _ in singles]
+            if color_sets:
+                colors = self._register_colors(colors)
+            rows = [{'id': num, 'color': color, 'strand': direction}
+                    for color, (_, (num, direction)) in zip(colors, singles)]
+            for p in range(0, len(rows), batch_size):
+                self.query("""
+                UNWIND $rows AS p MATCH (s:segment {id: p.id})
+                SET s.paths = coalesce(s.paths, []) + [p.color],
+                    s.path_strands = coalesce(s.path_strands, []) + [p.strand]
+                """, {"rows": rows[p:p + batch_size]})
+
+        if color_sets:
+            self._upload_color_sets(
+                "segment", self._color_set_edges(), progress, batch_size)
+            return
+
+        created = []
+        n_paths = len(self.gfa.paths)
+        for pt, path in enumerate(self.gfa.paths):
+            if progress is not None:
+                progress(f"Path {pt + 1}/{n_paths}", int(100 * pt / n_paths))
+            else:
+                print(f"\rPath {pt + 1}/{n_paths}", end="")
+            steps = [self._oriented_segment(seg)
+                     for seg in path.segment_names]
+            edges = [{'from': a[0], 'to': b[0], 'from_strand': a[1], 'to_strand': b[1]}
+                     for a, b in zip(steps, steps[1:])]
+            query = f"""
+            UNWIND $edges AS e
+            MATCH (a:segment {{id: e.from}}), (b:segment {{id: e.to}})
+            CREATE (a)-[r:{self._cypher_name(re.sub(r'[|:-]', '', path.name))} {{from_strand: e.from_strand, to_strand: e.to_strand}}]->(b)
+            RETURN ID(r) AS id
+            """
+            for e in range(0, len(edges), batch_size):
+                created.extend(record["id"] for record in self.query(
+                    query, {"edges": edges[e:e + batch_size]}))
+        if progress is None and n_paths > 0:
+            print()
+        self._rollback_if_cyclic(created, batch_size=batch_size)
+
+    def _color_set_edges(self, nodes: dict = None):
+        """
+        This method compute the adjacencies of the GFA file in self.gfa, with the ids of the colors of the paths that traverse them.
+
+        The links (L lines) are adjacencies also if no path traverses them.
+
+        :param nodes: The (base, id) of the nodes of every segment as in upload_from_gfa, default is None that means that the graph is compacted (type: dict)
+
+        :return: The color ids of every (from, from strand, to, to strand) adjacency, the strands are always + if the graph is not compacted (type: dict)
+        """
+        def walk(steps):
+            # nodes of a sequence of oriented segments
+            trail = []
+            for num, direction in steps:
+                if nodes is None:
+                    trail.append((num, direction))
+                elif direction == "+":
+                    trail.extend((el[1], "+") for el in nodes[num])
+                else:
+                    trail.extend((el[1], "+") for el in reversed(nodes[num]))
+            return trail
+
+        color_ids = self._register_colors(
+            [re.sub(r'[|:-]', '', path.name) for path in self.gfa.paths])
+        edges = {}
+        for path, color_id in zip(self.gfa.paths, color_ids):
+            trail = walk([self._oriented_segment(seg)
+                         for seg in path.segment_names])
+            for a, b in zip(trail, trail[1:]):
+                edges.setdefault(a + b, set()).add(color_id)
+        for link in self.gfa.dovetails:
+            a = walk([(int(link.from_segment.name), link.from_orient)])[-1]
+            b = walk([(int(link.to_segment.name), link.to_orient)])[0]
+            edges.setdefault(a + b, set())
+        return edges
+
+    def _register_colors(self, names: list):
+        """
+        This method add the colors to the registry of the names of the colors, the colors that are already in the registry keep their id.
+
+        :param names: The names of the colors (type: list)
+
+        :return: The id of every color (type: list)
+        """
+        res = self.query(
+            "MERGE (c:color_registry) ON CREATE SET c.names = [] RETURN c.names AS names")
+        registry = list(res[0]["names"])
+        for name in names:
+            if name not in registry:
+                registry.append(name)
+        self.query("MATCH (c:color_registry) SET c.names = $names",
+                   {"names": registry})
+        return [registry.index(name) for name in names]
+
+    def _upload_color_sets(self, label: str, edges: dict, progress=None, batch_size: int = 1000):
+        """
+        This method uploads the adjacencies computed by _color_set_edges as LINK relationships, with the ids of their colors in the colors property.
+
+        If an adjacency already exists, its colors are added to the ones of the relationship.
+        The relationships are uploaded in batches, so the graph is checked once at the end, as in _rollback_if_cyclic.
+
+        :raises ValueError: If the graph is not acyclic, the relationships created are removed and the colors added are removed from the other ones
+        """
+        rows = [{'from': key[0], 'from_strand': key[1], 'to': key[2], 'to_strand': key[3],
+                 'colors': sorted(colors)} for key, colors in edges.items()]
+        strands = " {from_strand: e.from_strand, to_strand: e.to_strand}" if label == "segment" else ""
+        # a relationship is new if it has no colors yet, the colors added are returned to undo the upload
+        query = f"""
+        UNWIND $edges AS e
+        MATCH (a:{label} {{id: e.from}}), (b:{label} {{id: e.to}})
+        MERGE (a)-[r:LINK{strands}]->(b)
+        WITH r, e, r.colors IS NULL AS created, coalesce(r.colors, []) AS colors
+        SET r.colors = colors + [c IN e.colors WHERE NOT c IN colors]
+        RETURN ID(r) AS id, created, [c IN e.colors WHERE NOT c IN colors] AS added
+        """
+        created = []
+        updated = []
+        for e in range(0, len(rows), batch_size):
+            if progress is not None:
+                progress(f"Adjacency {e + 1}/{len(rows)}",
+                         int(100 * e / len(rows)))
+            for record in self.query(query, {"edges": rows[e:e + batch_size]}):
+                if record["created"]:
+                    created.append(record["id"])
+                elif len(record["added"]) > 0:
+                    updated.append(
+                        {"id": record["id"], "colors": record["added"]})
+        self._rollback_if_cyclic(created, updated, batch_size)
+
+    def _rollback_if_cyclic(self, created: list, updated: list = None, batch_size: int = 1000):
+        """
+        This method check if the graph is acyclic after an upload in batches, if it is not the upload is undone.
+
+        The batches do not check every relationship as relation_upload, so the graph is checked once after the last batch.
+        The nodes of the upload are kept, as relation_upload keeps them.
+
+        :param created: The ids of the relationships created by the upload (type: list)
+        :param updated: The id and the colors added of the LINK relationships that existed before the upload, default is None (type: list of dict)
+        :param batch_size: Maximum number of relationships changed in a query, default is 1000 (type: int)
+
+        :raises ValueError: If the graph is not acyclic
+        """
+        if self.is_acyclic():
+            return
+        for i in range(0, len(created), batch_size):
+            self.query("UNWIND $ids AS i MATCH ()-[r]->() WHERE ID(r) = i DELETE r",
+                       {"ids": created[i:i + batch_size]})
+        updated = updated or []
+        for i in range(0, len(updated), batch_size):
+            self.query("""
+            UNWIND $rows AS row MATCH ()-[r]->() WHERE ID(r) = row.id
+            SET r.colors = [c IN r.colors WHERE NOT c IN row.colors]
+            """, {"rows": updated[i:i + batch_size]})
+        self.bump_version()
+        raise ValueError("Graph must be acyclic")
+
+    def delete_all(self, batch_size: int = 10000, progress=None):
+        if progress is not None:
+            progress("Deleting all nodes", None)
+        super().delete_all(batch_size)
+        self.bump_version()
+        self.compute_hashtable(progress=progress)
+
+    def delete_path(self, color: str, batch_size: int = 10000, progress=None):
+        """
+        This method delete a path of the graph, that is all the relationships of a color, in transactions of at most batch_size relationships.
+
+        Only the k-mers of the path are updated in the hash-table.
+        A k-mer of the path that was unique can only start in the nodes where the path starts its k-mers, within k-1 nodes before the deleted relationships, so it is searched only there.
+        A k-mer of the path that was in more nodes can be unique without the path and it is searched in the whole graph, only these k-mers are searched.
+        The changes are published as a new snapshot, in an OverlayHashtable on the current hash-table, so the hash-table is not copied and the readers of the current snapshot do not see the update.
+        If the hash-table is sharded, it is computed again.
 
-    def delete_all(self):
-        super().delete_all()
-        self.compute_hashtable()
+        :param color: The color of the path, that is the type of its relationships (type: str)
+        :param batch_size: Maximum number of relationships deleted in a transaction, default is 10000 (type: int)
+        :param progress: Function called as progress(message, percent) during the deletion, default is None (type: callable)
+
+        :return: The number of relationships deleted, with color sets the number of LINK relationships without the color anymore (type: int)
+        """
+        if progress is not None:
+            progress("Deleting path " + color, None)
+
+        with self._writer_lock:
+            records = list(self._kmer_records(progress, color=color))
+            affected = set(record[1] for record in records)
+            starts = sorted(set(record[0] for record in records))
+            color_names = self.color_names()
+            if color_names is None:
+                deleted = self.delete_in_batches(
+                    f"MATCH ()-[r:{self._cypher_name(color)}]->() WITH r LIMIT $limit DELETE r RETURN count(*) AS deleted", batch_size)
+            elif color in color_names:
+                # with color sets the color is removed from the LINK relationships, its id is kept
+                deleted = self.delete_in_batches("""
+                MATCH ()-[r:LINK]->() WHERE $color IN r.colors
+                WITH r LIMIT $limit
+                SET r.colors = [c IN r.colors WHERE c <> $color]
+                RETURN count(*) AS deleted
+                """, batch_size, {"color": color_names.index(color)})
+            else:
+                deleted = 0
+            if self.is_compacted() and (color_names is None or color in color_names):
+                # the paths of a single segment are in the properties of the segment
+                self.query("""
+                MATCH (s:segment) WHERE $color IN s.paths
+                SET s.path_strands = [i IN range(0, size(s.paths) - 1) WHERE s.paths[i] <> $color | s.path_strands[i]],
+                    s.paths = [c IN s.paths WHERE c <> $color]
+                """, {"color": color if color_names is None else color_names.index(color)})
+            self.bump_version()
+
+            snapshot = self._snapshot
+            if isinstance(snapshot.hashtable, ShardedHashtable):
+                self.compute_hashtable(progress=progress)
+                return deleted
+
+            hashtable = snapshot.hashtable
+            unique = [kmer for kmer in affected if kmer in hashtable]
+            repeated = [kmer for kmer in affected if kmer not in hashtable]
+
+            helper_dict = {}
+            for kmers, nodes in ((unique, starts), (repeated, None)):
+                if len(kmers) == 0:
+                    continue
+                # in canonical mode the k-mers are searched on both the strands
+                if self.canonical:
+                    kmers = kmers + [reverse_complement(kmer) for kmer in kmers]
+                for node, kmer, colors, strand in self._kmer_records(progress, kmers=kmers, nodes=nodes):
+                    helper_dict.setdefault(kmer, {}).setdefault(
+                        node, (strand, []))[1].extend(colors)
+
+            changes = {}
+            for kmer, nodes in helper_dict.items():
+                if len(nodes) == 1:
+                    node, (strand, colors) = nodes.popitem()
+                    changes[kmer] = self._hashtable_value(
+                        node, colors, strand)
+
+            self._publish(OverlayHashtable(
+                hashtable, changes, affected - changes.keys()))
+        return deleted
 
     def relation_upload(self, from_label: str, from_prop: dict, to_label: str, to_prop: dict, label: str = None, direction: int = 1, update: bool = True):
         super().relation_upload(from_label, from_prop, to_label, to_prop, label, direction)
         if not (self.is_acyclic()):
             super().reletion_remove(from_label, from_prop, to_label, to_prop, label, direction)
+        self.bump_version()
         if update:
             self.compute_hashtable()
 
+    def topological_ranks(self):
+        """
+        This method compute the position of every node of the graph in a topological order.
+
+        The positions are computed again only when the version of the graph changes.
+
+        :return: The position of every node id in the topological order (type: dict)
+        """
+        if self._topological_ranks is not None and self._topological_ranks[0] == self.graph_version:
+            return self._topological_ranks[1]
+
+        ranks = {node: rank for rank, node in enumerate(self.topological_order())}
+        self._topological_ranks = (self.graph_version, ranks)
+        return ranks
+
+    def topological_order(self):
+        """
+        This method compute a topological order of the nodes of the graph, with the Kahn algorithm.
+
+        :raises ValueError: If the graph is not acyclic
+
+        :return: The id of the nodes in topological order (type: list)
+        """
+        successors = self._successors()
+
+        in_degree = {node: 0 for node in successors}
+        for node in successors:
+            for next_node in successors[node]:
+                in_degree[next_node] = in_degree.get(next_node, 0) + 1
+
+        order = [node for node, degree in in_degree.items() if degree == 0]
+        for node in order:
+            for next_node in successors.get(node, []):
+                in_degree[next_node] -= 1
+                if in_degree[next_node] == 0:
+                    order.append(next_node)
+
+        if len(order) < len(in_degree):
+            raise ValueError("Graph must be acyclic")
+        return order
+
+    def renumber_topological(self, batch_size: int = 10000, progress=None):
+        """
+        This method change the ids of the nodes, so they are dense and in topological order: the first node has id 1 and every node has a greater id than the nodes before it.
+
+        In a compacted graph the bases of a segment keep consecutive ids, so the id of a segment is the one of the previous segment plus its length.
+        The nodes are updated by their internal id, in transactions of at most batch_size nodes, then the hash-table is computed again.
+
+        :param batch_size: Maximum number of nodes updated in a transaction, default is 10000 (type: int)
+        :param progress: Function called as progress(message, percent) during the update, default is None (type: callable)
+
+        :raises ValueError: If the graph is not acyclic
+
+        :return: The new id of every old id of a node, of a segment if the graph is compacted (type: dict)
+        """
+        if self.is_compacted():
+            query = "MATCH (s:segment) RETURN ID(s) AS node, toInteger(s.id) AS id, size(s.name) AS length"
+        else:
+            query = "MATCH (n) WHERE n.id IS NOT NULL RETURN ID(n) AS node, toInteger(n.id) AS id, 1 AS length"
+        nodes = {r["id"]: (r["node"], r["length"]) for r in self.run(query)}
+
+        rows = []
+        ids = {}
+        new_id = 1
+        for node_id in self.topological_order():
+            if node_id not in nodes:
+                continue
+            node, length = nodes[node_id]
+            rows.append({'node': node, 'id': new_id,
+                        'base_offset': new_id + 1})
+            ids[node_id] = new_id
+            new_id += length
+
+        update = "UNWIND $rows AS row MATCH (n) WHERE ID(n) = row.node SET n.id = row.id"
+        if self.is_compacted():
+            update += ", n.base_offset = row.base_offset"
+        for i in range(0, len(rows), batch_size):
+            if progress is not None:
+                progress(f"Renumbering node {i + 1}/{len(rows)}",
+                         int(100 * i / len(rows)))
+            self.query(update, {"rows": rows[i:i + batch_size]})
+
+        self.bump_version()
+        self.compute_hashtable(progress=progress)
+        return ids
+
+    def _successors(self):
+        # successors of every node, the nodes without id are not part of the graph
+        query = """
+        MATCH (n) WHERE n.id IS NOT NULL
+        OPTIONAL MATCH (n)-->(m)
+        RETURN toInteger(n.id) AS ID, collect(toInteger(m.id)) AS next
+        """
+        return {r["ID"]: r["next"] for r in self.run(query)}
+
+    def reachability_index(self, n_traversals: int = 3):
+        """
+        This method return the reachability index of the graph, see ReachabilityIndex.
+
+        The index is computed again only when the version of the graph changes.
+
+        :param n_traversals: The number of random traversals of the index, used only when it is computed, default is 3 (type: int)
+
+        :raises ValueError: If the graph is not acyclic
+
+        :return: The reachability index of the graph (type: ReachabilityIndex)
+        """
+        if self._reachability is None or self._reachability[0] != self.graph_version:
+            self._reachability = (self.graph_version, ReachabilityIndex(
+                self._successors(), n_traversals))
+        return self._reachability[1]
+
+    def reachable(self, a: int, b: int):
+        """
+        This method check if node b can be reached from node a, with the reachability index and without querying the database.
+
+        The ids are the ones of the hash-table, in a compacted graph they are ids of bases that are translated to their segments (see base_position), a base reaches the following bases of its segment.
+
+        :param a: The id of the first node (type: int)
+        :param b: The id of the second node (type: int)
+
+        :raises ValueError: If the graph is not acyclic
+        :raises KeyError: If a node is not in the graph
+
+        :return: True if there is a path from a to b, a node reaches itself (type: bool)
+        """
+        return self.reachable_many([(a, b)])[0]
+
+    def reachable_many(self, pairs):
+        """
+        This method check the reachability of many pairs of nodes, with the reachability index and without querying the database.
+
+        The ids are translated as in reachable, the pairs of bases in the same segment are compared by their offsets.
+
+        :param pairs: The (a, b) pairs of node ids (type: iterable of tuples)
+
+        :raises ValueError: If the graph is not acyclic
+        :raises KeyError: If a node is not in the graph
+
+        :return: For every pair, True if there is a path from a to b (type: list of bool)
+        """
+        index = self.reachability_index()
+        pairs = [(self.base_position(a), self.base_position(b))
+                 for a, b in pairs]
+        result = [None] * len(pairs)
+        others = []
+        for i, ((a, a_offset), (b, b_offset)) in enumerate(pairs):
+            if a == b:
+                result[i] = a_offset <= b_offset
+            else:
+                others.append(i)
+        for i, reachable in zip(others, index.reachable_many([(pairs[i][0][0], pairs[i][1][0]) for i in others])):
+            result[i] = reachable
+        return result
+
     def max_id(self):
         """
         This method return the maximum id of the graph
@@ -373,32 +1907,214 @@ class AlignmentFreeGraph(DBManager):
         :return: The maximum id of the graph (type: int)
         """
         query = "MATCH (n) RETURN max(toInteger(n.id)) as max"
-        res = self.graph.run(query)
+        res = self.run(query)
         for r in res:
             return r["max"]
 
+    async def async_max_id(self):
+        """
+        This method return the maximum id of the graph without blocking the event loop
+
+        :return: The maximum id of the graph (type: int)
+        """
+        query = "MATCH (n) RETURN max(toInteger(n.id)) as max"
+        res = await self.async_query(query)
+        return res[0]["max"]
+
     def get_hashtable_df(self):
         """
         This method return the hash-table of the graph as a pandas DataFrame
 
+        The DataFrame is computed on the first request after the hash-table changes, with Arrow columns if pyarrow is installed.
+
         :return: The hash-table of the graph as a pandas DataFrame
         """
-        return self.hashtable_df
+        snapshot = self._snapshot
+        if snapshot.hashtable_df is None:
+            snapshot.hashtable_df = self._hashtable_df_from_hashtable(snapshot)
+        return snapshot.hashtable_df
 
-    def export_hashtable(self, file_path: str):
+    def export_hashtable(self, file_path: str, chunk_size: int = 100000):
         """
         This method export the hash-table of the graph in a file.
 
+        The format is chosen by the extension of the file: '.parquet' for Parquet, '.arrow' or '.feather' for Arrow IPC, '.csv' for CSV, '.xlsx' for Excel and JSON otherwise.
+        Parquet and Arrow files are columnar, they are written in chunks and the colors are dictionary-encoded, they can be loaded back with the import_hashtable method.
+
         :param file_path: The path of the file (type: str)
+        :param chunk_size: The number of k-mers written at a time in Parquet and Arrow files, default is 100000 (type: int)
         """
 
-        if file_path.endswith('.csv'):
-            self.get_hashtable_df().to_csv(file_path)
-
-        elif file_path.endswith('.xlsx'):
-            self.get_hashtable_df().to_excel(file_path)
+        snapshot = self._snapshot
+        if file_path.endswith(('.parquet', '.arrow', '.feather')):
+            self._write_hashtable_columnar(
+                file_path, snapshot.hashtable.items(), snapshot.k, snapshot.canonical, chunk_size)
+
+        elif file_path.endswith(('.csv', '.xlsx')):
+            hashtable_df = self.get_hashtable_df()
+            # the colors are written as Python lists, as in the DataFrame without Arrow columns
+            hashtable_df = hashtable_df.assign(
+                colors=hashtable_df['colors'].tolist())
+            if file_path.endswith('.csv'):
+                hashtable_df.to_csv(file_path)
+            else:
+                hashtable_df.to_excel(file_path)
 
         else:
             import json
+            hashtable = snapshot.hashtable
+            if not isinstance(hashtable, dict):
+                hashtable = dict(hashtable.items())
             with open(file_path, 'w') as f:
-                json.dump(self.hashtable, f, indent=4)
+                json.dump(hashtable, f, indent=4)
+
+    def import_hashtable(self, file_path: str):
+        """
+        This method import a hash-table exported in a Parquet or Arrow file, without querying the database.
+
+        The hash-table and its DataFrame are replaced by the content of the file and the k parameter is set to the one used to compute it.
+
+        :param file_path: The path of the file, it must end with '.parquet', '.arrow' or '.feather' (type: str)
+
+        :raises ValueError: If the format of the file is not supported
+
+        :return: The hash-table of the graph
+        """
+        import pyarrow as pa
+
+        if file_path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            source = pq.ParquetFile(file_path)
+            schema = source.schema_arrow
+            batches = (batch for i in range(source.num_row_groups)
+                       for batch in source.read_row_group(i).to_batches())
+        elif file_path.endswith(('.arrow', '.feather')):
+            source = pa.ipc.open_file(pa.memory_map(file_path))
+            schema = source.schema
+            batches = (source.get_batch(i)
+                       for i in range(source.num_record_batches))
+        else:
+            raise ValueError("Format of the file not supported")
+
+        k = self.k
+        if schema.metadata is not None and b"k" in schema.metadata:
+            k = int(schema.metadata[b"k"])
+        canonical = "strand" in schema.names
+
+        hashtable = {}
+        for batch in batches:
+            if canonical:
+                strands = batch.column("strand").to_pylist()
+            else:
+                strands = [None] * batch.num_rows
+            for start, kmer, colors, strand in zip(batch.column("start").to_pylist(), batch.column("Kmer").to_pylist(),
+                                                   batch.column("colors").to_pylist(), strands):
+                hashtable[kmer] = (start, colors, strand) if canonical else (
+                    start, colors)
+
+        with self._writer_lock:
+            self.k = k
+            self.canonical = canonical
+            self._publish(hashtable, self._bloom_filter_of(hashtable))
+
+        return hashtable
+
+    def _write_hashtable_columnar(self, file_path: str, items, k: int, canonical: bool, chunk_size: int = 100000):
+        """
+        This method write the (k-mer, (start, colors)) items of a hash-table computed with k and canonical in a Parquet or Arrow file, chunk by chunk.
+
+        The colors are stored as a list of dictionary-encoded strings, the dictionary grows while the chunks are written.
+        """
+        import pyarrow as pa
+
+        fields = [("start", pa.int64()), ("Kmer", pa.string()),
+                  ("colors", pa.list_(pa.dictionary(pa.int32(), pa.string())))]
+        if canonical:
+            fields.append(("strand", pa.string()))
+        schema = pa.schema(fields, metadata={"k": str(k),
+                                             "canonical": str(int(canonical))})
+        if file_path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(file_path, schema)
+        else:
+            writer = pa.ipc.new_file(file_path, schema,
+                                     options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+        color_ids = {}
+        items = iter(items)
+        with writer:
+            while True:
+                chunk = list(itertools.islice(items, chunk_size))
+                if len(chunk) == 0:
+                    break
+                writer.write_batch(pa.record_batch(
+                    self._hashtable_arrow_columns(chunk, color_ids, canonical), schema=schema))
+
+    @staticmethod
+    def _hashtable_arrow_columns(items, color_ids: dict, canonical: bool):
+        """
+        This method convert the (k-mer, (start, colors)) items in the Arrow columns of the hash-table.
+
+        :param items: The items of the hash-table
+        :param color_ids: The index of every color in the dictionary of the colors, the new colors are added to it (type: dict)
+        :param canonical: If True the items have the strand of the k-mer (type: bool)
+
+        :return: The start, Kmer, colors and, in canonical mode, strand columns (type: list of pyarrow.Array)
+        """
+        import pyarrow as pa
+
+        starts, kmers, offsets, indices, strands = [], [], [0], [], []
+        for kmer, value in items:
+            starts.append(value[0])
+            kmers.append(kmer)
+            if canonical:
+                strands.append(value[2])
+            for color in value[1]:
+                indices.append(color_ids.setdefault(color, len(color_ids)))
+            offsets.append(len(indices))
+        colors = pa.ListArray.from_arrays(pa.array(offsets, pa.int32()),
+                                          pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()),
+                                                                         pa.array(list(color_ids), pa.string())))
+        columns = [pa.array(starts, pa.int64()),
+                   pa.array(kmers, pa.string()), colors]
+        if canonical:
+            columns.append(pa.array(strands, pa.string()))
+        return columns
+
+    def _hashtable_df_from_hashtable(self, snapshot: IndexSnapshot):
+        """
+        This method compute the DataFrame of the hash-table of a snapshot.
+
+        The columns are built directly from the hash-table, as Arrow arrays with the colors dictionary-encoded if pyarrow is installed.
+
+        :return: The hash-table of the graph as a pandas DataFrame sorted by start node
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+
+        if pa is not None:
+            names = ['start', 'Kmer', 'colors']
+            if snapshot.canonical:
+                names.append('strand')
+            table = pa.table(self._hashtable_arrow_columns(
+                snapshot.hashtable.items(), {}, snapshot.canonical), names=names)
+            table = table.sort_by('start')
+            return pd.DataFrame({name: pd.arrays.ArrowExtensionArray(table.column(name))
+                                 for name in names})
+
+        columns = {'start': [], 'Kmer': [], 'colors': []}
+        if snapshot.canonical:
+            columns['strand'] = []
+        for kmer, value in snapshot.hashtable.items():
+            columns['start'].append(value[0])
+            columns['Kmer'].append(kmer)
+            columns['colors'].append(value[1])
+            if snapshot.canonical:
+                columns['strand'].append(value[2])
+        hashtable_df = pd.DataFrame(columns)
+        if len(hashtable_df) > 0:
+            hashtable_df.sort_values(by='start', inplace=True, kind='stable')
+            hashtable_df.reset_index(drop=True, inplace=True)
+        return hashtable_df
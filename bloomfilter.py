@@ -0,0 +1,76 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+
+    """
+    Bloom filter, a compact approximate set of strings.
+
+    An item that was added is always found, an item that was not added is found with a probability close to the error rate, so a negative answer is always correct.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Bloom filter constructor
+
+        The number of bits and of hash functions are chosen to have the given error rate when the filter contains capacity items.
+
+        :param capacity: The number of items that will be added (type: int)
+        :param error_rate: The false positive rate, default is 0.01 (type: float)
+
+        :raises ValueError: If error_rate is not between 0 and 1
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.n_bits = max(8, math.ceil(-self.capacity *
+                          math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.n_items = 0
+
+    def _positions(self, item: str):
+        # double hashing on the two halves of a single digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.n_items += 1
+
+    def update(self, other):
+        """
+        This method add the items of another Bloom filter, with the same capacity and error rate, setting the bits set in one of the two filters.
+
+        :param other: The other Bloom filter (type: BloomFilter)
+
+        :raises ValueError: If the filters have a different number of bits or of hash functions
+        """
+        if other.n_bits != self.n_bits or other.n_hashes != self.n_hashes:
+            raise ValueError("Bloom filters with different parameters")
+        bits = int.from_bytes(self.bits, "little") | int.from_bytes(
+            other.bits, "little")
+        self.bits = bytearray(bits.to_bytes(len(self.bits), "little"))
+        self.n_items += other.n_items
+
+    def __contains__(self, item: str):
+        for position in self._positions(item):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.n_items
+
+    def memory_usage(self):
+        """
+        This method return the memory used by the bits of the filter.
+
+        :return: The size of the filter in bytes (type: int)
+        """
+        return len(self.bits)
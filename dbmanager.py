@@ -1,6 +1,10 @@
+import asyncio
+import itertools
 import json
+import time
 import matplotlib.pyplot as plt
 from py2neo import Graph
+from querytracer import QueryTracer, TracedCursor
 
 
 class DBManager:
@@ -33,6 +37,10 @@ class DBManager:
             self.db_name = ""
 
         self.graph = None
+        self.driver = None
+        # asynchronous drivers, one for every event loop
+        self.async_drivers = {}
+        self.tracer = None
         self.connect()
 
     def set_values(self, location: str = None, db_name: str = None, username: str = None, password: str = None, configuration: [dict, str] = None):
@@ -82,6 +90,9 @@ class DBManager:
         """
         self.set_values(location, db_name, username, password, configuration)
 
+        # the drivers of the neo4j package are created again with the new values when they are needed
+        self.close_driver()
+        self.async_drivers = {}
         self.graph = Graph(self.location + "/" + self.db_name,
                            auth=(self.username, self.password))
 
@@ -108,7 +119,7 @@ class DBManager:
         """
 
         try:
-            self.graph.run("RETURN 1")
+            self.run("RETURN 1").data()
             return True
         except Exception as e:
             print(f"Connection error: {e}")
@@ -187,6 +198,7 @@ class DBManager:
         :param label: Label of the node, default None
 
         If the label is not specified, the label of the node must be specified in the node dictionary.
+        The properties are stored with their type, see _property_value.
 
         :raises ValueError: If the label is not specified
         """
@@ -198,13 +210,11 @@ class DBManager:
             else:
                 raise ValueError("Label not specified")
 
-        query = "CREATE (:" + label + " {"
-        for key, value in node.items():
-            if key != "label":
-                query += str(key) + ": '" + str(value) + "', "
-        query = query[:-2] + "})"
+        properties = {str(key): self._property_value(value)
+                      for key, value in node.items() if key != "label"}
 
-        self.graph.run(query)
+        self.query("CREATE (:" + label + " $properties)",
+                   {"properties": properties})
 
     def nodes_upload(self, nodes: list, label: str = None):
         """
@@ -260,15 +270,11 @@ class DBManager:
         else:
             raise ValueError("Direction incorrect")
 
-        query = "MATCH (a:" + from_label + "), (b:" + to_label + ") WHERE "
-        for key, value in from_prop.items():
-            query += "a." + str(key) + " = '" + str(value) + "' AND "
-        for key, value in to_prop.items():
-            query += "b." + str(key) + " = '" + str(value) + "' AND "
-        query = query[:-5] + " CREATE (a)" + direction[0] + \
-            "[:" + label + "]" + direction[1] + "(b)"
+        conditions, parameters = self._match_properties(from_prop, to_prop)
+        query = "MATCH (a:" + from_label + "), (b:" + to_label + ")" + conditions + \
+            " CREATE (a)" + direction[0] + "[:" + label + "]" + direction[1] + "(b)"
 
-        self.graph.run(query)
+        self.query(query, parameters)
 
     def reletion_remove(self, from_label: str, from_prop: dict, to_label: str, to_prop: dict, label: str = None, direction: int = 1):
 
@@ -282,15 +288,43 @@ class DBManager:
         else:
             raise ValueError("Direction incorrect")
 
+        conditions, parameters = self._match_properties(from_prop, to_prop)
         query = "MATCH (a:" + from_label + \
-            ")-[r:" + label + "]->(b:" + to_label + ") WHERE "
-        for key, value in from_prop.items():
-            query += "a." + str(key) + " = '" + str(value) + "' AND "
-        for key, value in to_prop.items():
-            query += "b." + str(key) + " = '" + str(value) + "' AND "
-        query = query[:-5] + " DELETE r"
+            ")-[r:" + label + "]->(b:" + to_label + ")" + conditions + " DELETE r"
 
-        self.graph.run(query)
+        self.query(query, parameters)
+
+    @staticmethod
+    def _property_value(value):
+        """
+        This method return the value of a property as it is stored in the database.
+
+        Numbers, strings, booleans and lists of them keep their type, the other values are stored as strings.
+        """
+        primitive = (bool, int, float, str)
+        if value is None or isinstance(value, primitive):
+            return value
+        if isinstance(value, (list, tuple)) and all(isinstance(v, primitive) for v in value):
+            return list(value)
+        return str(value)
+
+    @staticmethod
+    def _match_properties(from_prop: dict, to_prop: dict):
+        """
+        This method return the WHERE clause that match the properties of the nodes a and b of a relation, with the values as parameters so they are compared with their type.
+
+        :return: The clause, empty if there are no properties, and its parameters (type: tuple)
+        """
+        conditions = []
+        parameters = {}
+        for variable, properties in (("a", from_prop), ("b", to_prop)):
+            for i, (key, value) in enumerate(properties.items()):
+                conditions.append(
+                    f"{variable}.{DBManager._cypher_name(str(key))} = ${variable}{i}")
+                parameters[f"{variable}{i}"] = DBManager._property_value(value)
+        if len(conditions) == 0:
+            return "", parameters
+        return " WHERE " + " AND ".join(conditions), parameters
 
     def relation_dict_upload(self, relation: dict, label: str = None, direction: int = 1):
         """
@@ -324,19 +358,283 @@ class DBManager:
         for relation in relations:
             self.relation_dict_upload(relation, label, direction)
 
-    def query(self, query: str):
+    def query(self, query: str, parameters: dict = None):
         """
         This method execute a query to the database.
 
         :param query: Query to execute
+        :param parameters: Parameters of the query, default None (is optional)
 
         :return: Result of the query
         """
 
-        return self.graph.run(query).data()
+        return self.run(query, parameters).data()
+
+    def stream(self, query: str, parameters: dict = None, fetch_size: int = 1000):
+        """
+        This method execute a query to the database and yield the records of the result while they arrive.
+
+        The query is executed with the driver of the neo4j package, that fetch the records from the server fetch_size at a time, so the memory depends on fetch_size and not on the size of the result.
+        The session is open until the generator is read to the end or closed.
+        The nodes and the relationships in the records are the ones of the neo4j package, the queries that need the same records of query should return their properties.
+
+        :param query: Query to execute
+        :param parameters: Parameters of the query, default None (is optional)
+        :param fetch_size: Number of records fetched from the server at a time, default 1000
+
+        :return: Generator of the records of the result, as dictionaries
+        """
+        seconds = 0.0
+        rows = 0
+        try:
+            start = time.perf_counter()
+            with self.get_driver().session(database=self.db_name or None, fetch_size=fetch_size) as session:
+                records = iter(session.run(query, parameters or {}))
+                seconds += time.perf_counter() - start
+                while True:
+                    # only the time spent in the driver is counted, as in TracedCursor
+                    start = time.perf_counter()
+                    record = next(records, None)
+                    seconds += time.perf_counter() - start
+                    if record is None:
+                        return
+                    rows += 1
+                    yield dict(record.items())
+        finally:
+            if self.tracer is not None:
+                self.tracer.record(query, parameters, rows, seconds)
+
+    def stream_batches(self, query: str, parameters: dict = None, batch_size: int = 1000):
+        """
+        This method execute a query to the database and yield the records of the result in lists of batch_size records, see stream.
+
+        :param query: Query to execute
+        :param parameters: Parameters of the query, default None (is optional)
+        :param batch_size: Number of records in a batch, the last one can be smaller, it is also the number of records fetched at a time, default 1000
+
+        :return: Generator of the batches of records
+        """
+        records = self.stream(query, parameters, batch_size)
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if len(batch) == 0:
+                return
+            yield batch
+
+    def paginate(self, query: str, parameters: dict = None, batch_size: int = 1000, start=-1):
+        """
+        This method execute a query page by page, with key-based pagination, so every page is a short query and the database does not skip the previous pages.
+
+        The query must return the records with key greater than $last, ordered by a column named key, and at most $limit records.
+        The key should be an indexed property, otherwise every page scans and sorts all the records, to read a whole result stream is faster.
+
+        :param query: Query to execute
+        :param parameters: Other parameters of the query, default None (is optional)
+        :param batch_size: Number of records in a page, default 1000
+        :param start: Value smaller than all the keys, default -1
+
+        :return: Generator of the pages of records
+        """
+        last = start
+        while True:
+            page = self.query(query, dict(
+                parameters or {}, last=last, limit=batch_size))
+            if len(page) == 0:
+                return
+            last = page[-1]["key"]
+            yield page
+
+    def run(self, query: str, parameters: dict = None):
+        """
+        This method execute a query to the database and return its result without reading it, all the queries are executed by this method.
+
+        If the tracing is enabled, the query is recorded when its result is read to the end.
+
+        :param query: Query to execute
+        :param parameters: Parameters of the query, default None (is optional)
+
+        :return: Cursor of the result of the query, that can be iterated or read with data()
+        """
+        if self.tracer is None:
+            return self.graph.run(query, parameters)
 
-    def delete_all(self):
-        self.graph.delete_all()
+        profiled = self.tracer.should_profile(query)
+        start = time.perf_counter()
+        cursor = self.graph.run(
+            "PROFILE " + query if profiled else query, parameters)
+        return TracedCursor(cursor, self.tracer, query, parameters,
+                            time.perf_counter() - start, profiled)
+
+    def enable_tracing(self, slow_threshold: float = 1.0, profile_rate: float = 0.0):
+        """
+        This method start to record the statistics of the queries, the previous statistics are deleted.
+
+        :param slow_threshold: The time in seconds over which a query is logged as slow, default 1.0
+        :param profile_rate: The fraction of the queries executed with PROFILE to keep their plan, default 0.0
+
+        :return: The tracer of the queries (type: QueryTracer)
+        """
+        self.tracer = QueryTracer(slow_threshold, profile_rate)
+        return self.tracer
+
+    def disable_tracing(self):
+        """
+        This method stop to record the statistics of the queries.
+        """
+        self.tracer = None
+
+    def get_query_stats(self):
+        """
+        This method return the statistics of the queries, if the tracing is enabled.
+
+        :return: The statistics of every query template and the slow queries, None if the tracing is disabled (type: dict)
+        """
+        if self.tracer is None:
+            return None
+        return self.tracer.stats()
+
+    def export_query_stats(self, file_path: str = 'query_stats.json'):
+        """
+        This method export the statistics of the queries in a JSON file.
+
+        :param file_path: Path of the file, default 'query_stats.json'
+
+        :raises ValueError: If the tracing is disabled
+        """
+        if self.tracer is None:
+            raise ValueError("Tracing not enabled")
+        self.tracer.export_json(file_path)
+
+    def get_driver(self):
+        """
+        This method return the driver of the neo4j package, it is created on the first call, it is used by stream to fetch the records of a result a batch at a time.
+
+        :return: The driver (type: neo4j.Driver)
+        """
+        if self.driver is None:
+            from neo4j import GraphDatabase
+            self.driver = GraphDatabase.driver(
+                self.location, auth=(self.username, self.password))
+        return self.driver
+
+    def close_driver(self):
+        """
+        This method close the driver of the neo4j package, if it was created.
+        """
+        if self.driver is not None:
+            self.driver.close()
+            self.driver = None
+
+    def get_async_driver(self):
+        """
+        This method return the asynchronous driver of the database for the running event loop, it is created on the first call in that loop.
+
+        A driver of the neo4j package and its connections are bound to the event loop where it is used first, so every loop, as the one of every asyncio.run, has its own driver.
+        The drivers of the loops that are closed are dropped, their connections cannot be closed without their loop.
+        The driver is the one of the neo4j package, that is imported only here because it is needed only by the asynchronous methods.
+
+        :return: The asynchronous driver (type: neo4j.AsyncDriver)
+        """
+        loop = asyncio.get_running_loop()
+        for closed in [other for other in self.async_drivers if other.is_closed()]:
+            del self.async_drivers[closed]
+        if loop not in self.async_drivers:
+            from neo4j import AsyncGraphDatabase
+            self.async_drivers[loop] = AsyncGraphDatabase.driver(
+                self.location, auth=(self.username, self.password))
+        return self.async_drivers[loop]
+
+    async def async_query(self, query: str, parameters: dict = None):
+        """
+        This method execute a query to the database without blocking the event loop.
+
+        :param query: Query to execute
+        :param parameters: Parameters of the query, default None (is optional)
+
+        :return: Result of the query
+        """
+        start = time.perf_counter()
+        async with self.get_async_driver().session(database=self.db_name or None) as session:
+            result = await session.run(query, parameters or {})
+            data = await result.data()
+        if self.tracer is not None:
+            self.tracer.record(query, parameters, len(data),
+                               time.perf_counter() - start)
+        return data
+
+    async def async_query_many(self, queries: list, max_concurrency: int = 8):
+        """
+        This method execute many independent queries to the database concurrently.
+
+        :param queries: Queries to execute, each one is a string or a (query, parameters) pair
+        :param max_concurrency: Maximum number of queries executed at the same time, default 8
+
+        :raises ValueError: If max_concurrency is less than 1
+
+        :return: Results of the queries, in the same order of the queries
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than 0")
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(query):
+            if isinstance(query, str):
+                query = (query, None)
+            async with semaphore:
+                return await self.async_query(*query)
+
+        return await asyncio.gather(*(run(query) for query in queries))
+
+    async def async_is_acyclic(self):
+        query = """
+        OPTIONAL MATCH path = (startNode)-[*]->(startNode)
+        WITH COLLECT(path) AS paths
+        RETURN REDUCE(acc = false, p IN paths | acc OR length(p) > 1) AS isCyclic
+        """
+        result = await self.async_query(query)
+
+        return not result[0]["isCyclic"]
+
+    async def async_close(self):
+        """
+        This method close the asynchronous driver of the running event loop, if it was created.
+        """
+        driver = self.async_drivers.pop(asyncio.get_running_loop(), None)
+        if driver is not None:
+            await driver.close()
+
+    def delete_all(self, batch_size: int = 10000):
+        """
+        This method delete all the nodes and relationships of the database.
+
+        The relationships and then the nodes are deleted in transactions of at most batch_size elements, so a large database does not exhaust the memory of the server.
+
+        :param batch_size: Maximum number of elements deleted in a transaction, default 10000
+        """
+        self.delete_in_batches(
+            "MATCH ()-[r]->() WITH r LIMIT $limit DELETE r RETURN count(*) AS deleted", batch_size)
+        self.delete_in_batches(
+            "MATCH (n) WITH n LIMIT $limit DETACH DELETE n RETURN count(*) AS deleted", batch_size)
+
+    def delete_in_batches(self, query: str, batch_size: int = 10000, parameters: dict = None):
+        """
+        This method execute a delete query until it does not delete anything, each execution is a transaction.
+
+        The query must use the $limit parameter to delete at most batch_size elements and return their number as 'deleted'.
+
+        :param query: Query to execute
+        :param batch_size: Maximum number of elements deleted in a transaction, default 10000
+        :param parameters: Other parameters of the query, default None (is optional)
+
+        :return: The number of elements deleted
+        """
+        parameters = dict(parameters or {}, limit=batch_size)
+        total = 0
+        while True:
+            deleted = self.query(query, parameters)[0]["deleted"]
+            total += deleted
+            if deleted < batch_size:
+                return total
 
     def get_all_nodes(self, label: str = None, limit: int = None, order: bool = None):
         """
@@ -365,6 +663,19 @@ class DBManager:
 
         return self.query(query)
 
+    def iter_all_nodes(self, label: str = None, batch_size: int = 1000):
+        """
+        This method yield all the nodes of the database, with a single query whose records are fetched batch_size at a time (see stream).
+
+        :param label: Label of the nodes, default None (is optional)
+        :param batch_size: Number of nodes fetched at a time, default 1000
+
+        :return: Generator of the nodes, as nodes of the neo4j package
+        """
+        query = "MATCH (n" + ("" if label is None else ":" + label) + ") RETURN n"
+        for record in self.stream(query, fetch_size=batch_size):
+            yield record["n"]
+
     def get_all_relationships(self, label: str = None, limit: int = None):
         """
         This method return all the relationships of the database.
@@ -387,6 +698,21 @@ class DBManager:
 
         return self.query(query)
 
+    def iter_all_relationships(self, label: str = None, batch_size: int = 1000):
+        """
+        This method yield all the relationships of the database, with a single query whose records are fetched batch_size at a time (see stream).
+
+        Unlike get_all_relationships, every relationship is read once, in its direction.
+
+        :param label: Label of the relationships, default None (is optional)
+        :param batch_size: Number of relationships fetched at a time, default 1000
+
+        :return: Generator of the relationships, as relationships of the neo4j package
+        """
+        query = "MATCH ()-[r" + ("" if label is None else ":" + label) + "]->() RETURN r"
+        for record in self.stream(query, fetch_size=batch_size):
+            yield record["r"]
+
     def get_networkx_di_graph(self):
         """
         This method return the direct graph (DiGraph) of the database in the form of a networkx graph.
@@ -397,56 +723,113 @@ class DBManager:
 
         query = """
         MATCH (n)-[r]->(m)
-        RETURN n, r, m
+        RETURN n.id AS from_id, n.name AS from_name, type(r) AS type, r.colors AS colors,
+            m.id AS to_id, m.name AS to_name
         """
-        result = self.query(query)
+        # the records are fetched while the graph is built
+        result = self.stream(query)
+
+        # with color sets the label of a LINK relationship is made of the names of its colors
+        registry = self.query("MATCH (c:color_registry) RETURN c.names AS names")
+        color_names = registry[0]["names"] if len(registry) > 0 else None
 
         graph_nx = nx.DiGraph()
 
         for record in result:
-            node1 = record["n"]
-            node2 = record["m"]
-            relationship = record["r"]
-
-            graph_nx.add_node(node1["id"], name=node1["name"])
-            graph_nx.add_node(node2["id"], name=node2["name"])
-
-            if graph_nx.has_edge(node1["id"], node2["id"]):
-                graph_nx[node1["id"]][node2["id"]]["label"] += "+" + \
-                    (type(relationship).__name__)
+            node1 = record["from_id"]
+            node2 = record["to_id"]
+            label = record["type"]
+            if label == "LINK" and color_names is not None:
+                label = "+".join(color_names[c]
+                                 for c in record["colors"])
+
+            graph_nx.add_node(node1, name=record["from_name"])
+            graph_nx.add_node(node2, name=record["to_name"])
+
+            if graph_nx.has_edge(node1, node2):
+                graph_nx[node1][node2]["label"] += "+" + label
             else:
-                graph_nx.add_edge(node1["id"], node2["id"],
-                                  label=type(relationship).__name__)
+                graph_nx.add_edge(node1, node2, label=label)
 
         return graph_nx
 
-    def export_database_to_cypher(self, file_path: str = 'cypher_queries.txt'):
-        # Get all nodes and relationships
-        nodes = self.get_all_nodes()
-        relationships = self.get_all_relationships()
+    def export_database_to_cypher(self, file_path: str = 'cypher_queries.txt', batch_size: int = 1000, compress: bool = None):
+        """
+        This method export the database in a file of Cypher statements, that can be replayed to rebuild the graph.
 
-        # Initialize list of Cypher queries
-        cypher_queries = []
+        Nodes and relationships are read with one query each, their records are fetched batch_size at a time (see stream) and each batch is written as UNWIND statements, so the memory used depends on batch_size and not on the size of the graph.
+        Relationships are read only in their direction, and they are created matching their nodes by the 'id' property, for this reason the file starts with an index on 'id' for every label.
 
-        # Convert nodes to Cypher queries
-        for node in nodes:
-            query = f"CREATE (n:{list(node['n'].labels)[0]} "
-            if len(node['n'].items()) > 1:
-                query += "{"
-                for key, value in node['n'].items():
-                    if key != 'label':
-                        query += f"{key}: '{value}', "
-                    query = query[:-2] + "}"
-            query += ")"
-            cypher_queries.append(query)
-        cypher_queries
-
-        # Convert relationships to Cypher queries
-        for relationship in relationships:
-            query = f"MATCH (a:{relationship['r']['start']['label']}),(b:{relationship['r']['end']['label']}) WHERE a.id = {relationship['r']['start']['id']} AND b.id = {relationship['r']['end']['id']} CREATE (a)-[r:{relationship['r']['label']}]->(b);"
-            cypher_queries.append(query)
-
-        # Write Cypher queries to text file
-        with open(file_path, 'w') as file:
-            for query in cypher_queries:
-                file.write(query + '\n')
+        :param file_path: Path of the file, default 'cypher_queries.txt'
+        :param batch_size: Number of nodes or relationships for each page and statement, default 1000
+        :param compress: If True the file is compressed with gzip, default None (the file is compressed if file_path ends with '.gz')
+        """
+
+        if compress is None:
+            compress = file_path.endswith('.gz')
+        if compress:
+            import gzip
+            file = gzip.open(file_path, 'wt')
+        else:
+            file = open(file_path, 'w')
+
+        with file:
+            for record in self.query("CALL db.labels() YIELD label RETURN label"):
+                file.write(
+                    f"CREATE INDEX IF NOT EXISTS FOR (n:{self._cypher_name(record['label'])}) ON (n.id);\n")
+
+            # Nodes grouped by labels
+            query = "MATCH (n) RETURN labels(n) AS labels, properties(n) AS properties"
+            for page in self.stream_batches(query, batch_size=batch_size):
+                groups = {}
+                for record in page:
+                    groups.setdefault(tuple(record["labels"]), []).append(
+                        record["properties"])
+                for labels, rows in groups.items():
+                    file.write(f"UNWIND {self._cypher_literal(rows)} AS row CREATE (n{self._cypher_labels(labels)}) "
+                               "SET n = row;\n")
+
+            # Relationships grouped by type and labels of their nodes
+            query = """
+            MATCH (a)-[r]->(b)
+            RETURN type(r) AS type, properties(r) AS properties,
+                labels(a) AS from_labels, a.id AS from_id, labels(b) AS to_labels, b.id AS to_id
+            """
+            for page in self.stream_batches(query, batch_size=batch_size):
+                groups = {}
+                for record in page:
+                    groups.setdefault((tuple(record["from_labels"]), tuple(record["to_labels"]), record["type"]), []).append(
+                        {"from": record["from_id"], "to": record["to_id"], "properties": record["properties"]})
+                for (from_labels, to_labels, label), rows in groups.items():
+                    file.write(f"UNWIND {self._cypher_literal(rows)} AS row "
+                               f"MATCH (a{self._cypher_labels(from_labels)} {{id: row.from}}), (b{self._cypher_labels(to_labels)} {{id: row.to}}) "
+                               f"CREATE (a)-[r:{self._cypher_name(label)}]->(b) SET r = row.properties;\n")
+
+    @staticmethod
+    def _cypher_name(name: str):
+        """
+        This method escape a label, a relationship type or a property key for a Cypher statement.
+        """
+        return "`" + str(name).replace("`", "``") + "`"
+
+    @staticmethod
+    def _cypher_labels(labels):
+        return "".join(":" + DBManager._cypher_name(label) for label in labels)
+
+    @staticmethod
+    def _cypher_literal(value):
+        """
+        This method convert a python value in a Cypher literal, keeping its type.
+        """
+        if value is None:
+            return "null"
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (int, float)):
+            return repr(value)
+        if isinstance(value, dict):
+            return "{" + ", ".join(DBManager._cypher_name(key) + ": " + DBManager._cypher_literal(item)
+                                   for key, item in value.items()) + "}"
+        if isinstance(value, (list, tuple)):
+            return "[" + ", ".join(DBManager._cypher_literal(item) for item in value) + "]"
+        return json.dumps(str(value))
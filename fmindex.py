@@ -0,0 +1,213 @@
+import numpy as np
+
+# code of the character at the end of the text, smaller than all the others
+TERMINATOR = 0
+# code of the character between two sequences, so a match never crosses two sequences
+SEPARATOR = 1
+
+
+def suffix_array(codes: np.ndarray):
+    """
+    This function compute the suffix array of a text by prefix doubling.
+
+    The last character of the text must be the only one with the smallest code.
+
+    :param codes: The codes of the characters of the text (type: numpy.ndarray)
+
+    :return: The start of the suffixes of the text in lexicographic order (type: numpy.ndarray)
+    """
+    n = len(codes)
+    rank = codes.astype(np.int64)
+    sa = np.argsort(rank, kind="stable")
+    length = 1
+    while length < n:
+        # the suffixes are sorted by their first 2 * length characters
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - length] = rank[length:]
+        sa = np.lexsort((second, rank))
+        changed = np.empty(n, dtype=bool)
+        changed[0] = False
+        changed[1:] = (rank[sa[1:]] != rank[sa[:-1]]) | (
+            second[sa[1:]] != second[sa[:-1]])
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.cumsum(changed)
+        if rank[sa[-1]] == n - 1:
+            break
+        length *= 2
+    return sa
+
+
+class FMIndex:
+
+    """
+    FM-index of a set of sequences, for the exact search of patterns of any length.
+
+    The index contains the Burrows-Wheeler transform of the concatenated sequences, the occurrences of every character sampled every occ_rate positions and the suffix array sampled every sa_rate positions of the text.
+    A pattern is counted in time proportional to its length, then every match is located by walking the transform back to a sampled position.
+    """
+
+    def __init__(self, sequences: list = None, sa_rate: int = 32, occ_rate: int = 64):
+        """
+        FM-index constructor
+
+        :param sequences: The sequences to index, default is None that means an empty index (type: list of str)
+        :param sa_rate: Every how many positions of the text the suffix array is sampled, default is 32 (type: int)
+        :param occ_rate: Every how many rows of the transform the occurrences are sampled, default is 64 (type: int)
+
+        :raises ValueError: If sa_rate or occ_rate are less than 1
+        """
+        if sa_rate < 1 or occ_rate < 1:
+            raise ValueError("sa_rate and occ_rate must be greater than 0")
+        self.sa_rate = sa_rate
+        self.occ_rate = occ_rate
+
+        sequences = [] if sequences is None else list(sequences)
+        self.alphabet = "".join(sorted(set("".join(sequences))))
+        lookup = np.zeros(256, dtype=np.uint8)
+        for code, character in enumerate(self.alphabet.encode("latin-1")):
+            lookup[character] = code + 2
+
+        # start of every sequence in the text, plus the end of the text
+        lengths = np.array([len(sequence) + 1 for sequence in sequences],
+                           dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(lengths)))
+        text = "".join(sequence + "\x01" for sequence in sequences) + "\x00"
+        codes = lookup[np.frombuffer(text.encode("latin-1"), dtype=np.uint8)]
+        codes[-1] = TERMINATOR
+        codes[self.starts[1:] - 1] = SEPARATOR
+
+        sa = suffix_array(codes)
+        self.bwt = codes[(sa - 1) % len(codes)]
+        self.sampled = sa % sa_rate == 0
+        self.sa_samples = sa[self.sampled]
+        self._prepare()
+
+    def _prepare(self):
+        # data computed again from the transform, so they are not saved
+        n_codes = len(self.alphabet) + 2
+        counts = np.bincount(self.bwt, minlength=n_codes)
+        self.first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        blocks = self.bwt[:len(self.bwt) - len(self.bwt) % self.occ_rate].reshape(
+            -1, self.occ_rate)
+        occ = np.zeros((len(blocks) + 1, n_codes), dtype=np.int64)
+        for code in range(n_codes):
+            occ[1:, code] = np.cumsum(
+                np.count_nonzero(blocks == code, axis=1))
+        self.occ = occ
+        blocks = self.sampled[:len(self.sampled) - len(self.sampled) %
+                              self.occ_rate].reshape(-1, self.occ_rate)
+        self.sampled_rank = np.concatenate(
+            ([0], np.cumsum(np.count_nonzero(blocks, axis=1))))
+
+    def _occurrences(self, code: int, row: int):
+        # occurrences of the code in the transform before the row
+        block = row // self.occ_rate
+        return int(self.occ[block, code]) + int(np.count_nonzero(
+            self.bwt[block * self.occ_rate:row] == code))
+
+    def _sample(self, row: int):
+        # position in the samples of the suffix array of a sampled row
+        block = row // self.occ_rate
+        return int(self.sampled_rank[block]) + int(np.count_nonzero(
+            self.sampled[block * self.occ_rate:row]))
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def count_range(self, pattern: str):
+        """
+        This method search a pattern by backward search.
+
+        :param pattern: The pattern (type: str)
+
+        :return: The first and the last plus one rows of the transform that start with the pattern, they are equal if the pattern is not found (type: tuple)
+        """
+        low, high = 0, len(self.bwt)
+        for character in reversed(pattern):
+            position = self.alphabet.find(character)
+            if position < 0:
+                return 0, 0
+            code = position + 2
+            low = int(self.first[code]) + self._occurrences(code, low)
+            high = int(self.first[code]) + self._occurrences(code, high)
+            if low >= high:
+                return 0, 0
+        return low, high
+
+    def count(self, pattern: str):
+        """
+        This method count the occurrences of a pattern in the sequences.
+
+        :param pattern: The pattern (type: str)
+
+        :return: The number of occurrences (type: int)
+        """
+        low, high = self.count_range(pattern)
+        return high - low
+
+    def locate(self, pattern: str):
+        """
+        This method find the occurrences of a pattern in the sequences.
+
+        :param pattern: The pattern (type: str)
+
+        :return: The (sequence, offset) pairs of the occurrences, sorted (type: list of tuple)
+        """
+        if len(pattern) == 0:
+            return []
+        low, high = self.count_range(pattern)
+        positions = []
+        for row in range(low, high):
+            steps = 0
+            # LF-mapping until a row with a sampled position
+            while not self.sampled[row]:
+                code = int(self.bwt[row])
+                row = int(self.first[code]) + self._occurrences(code, row)
+                steps += 1
+            positions.append(int(self.sa_samples[self._sample(row)]) + steps)
+
+        positions = np.sort(np.array(positions, dtype=np.int64))
+        sequences = np.searchsorted(self.starts, positions, side="right") - 1
+        return [(int(s), int(p - self.starts[s])) for s, p in zip(sequences, positions)]
+
+    def memory_usage(self):
+        """
+        This method return the memory used by the arrays of the index.
+
+        :return: The size of the index in bytes (type: int)
+        """
+        return sum(array.nbytes for array in (self.bwt, self.sampled, self.sa_samples,
+                                             self.starts, self.first, self.occ, self.sampled_rank))
+
+    def save(self, file_path: str, **arrays):
+        """
+        This method save the index in a compressed NumPy file.
+
+        :param file_path: Path of the file
+        :param arrays: Other arrays saved with the index
+        """
+        np.savez_compressed(file_path, bwt=self.bwt, sampled=self.sampled, sa_samples=self.sa_samples,
+                            starts=self.starts, alphabet=np.array(self.alphabet),
+                            rates=np.array([self.sa_rate, self.occ_rate]), **arrays)
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        This method load an index saved with save.
+
+        :param file_path: Path of the file
+
+        :return: The index and a dictionary with the other arrays saved with it (type: tuple)
+        """
+        with np.load(file_path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        index = cls.__new__(cls)
+        index.bwt = arrays.pop("bwt")
+        index.sampled = arrays.pop("sampled")
+        index.sa_samples = arrays.pop("sa_samples")
+        index.starts = arrays.pop("starts")
+        index.alphabet = str(arrays.pop("alphabet"))
+        index.sa_rate, index.occ_rate = (int(rate)
+                                         for rate in arrays.pop("rates"))
+        index._prepare()
+        return index, arrays
@@ -0,0 +1,238 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from alignmentfreegraph import AlignmentFreeGraph
+
+
+class GraphRegistry:
+
+    """
+    Registry of many named graphs served by one process.
+
+    A graph is registered with the parameters of its AlignmentFreeGraph, it is connected and its index is loaded only when it is requested.
+    When the memory of the loaded indexes is over the budget, the least recently used graphs are evicted, their index is saved first if the graph has an index file that is missing or older than the graph.
+    A graph is loaded and saved without holding the lock of the registry, so the other graphs are served meanwhile, the requests of the same graph wait for the same load or for the end of the save.
+    """
+
+    def __init__(self, memory_budget: int = None):
+        """
+        Graph registry constructor
+
+        :param memory_budget: The maximum memory in bytes of the loaded indexes, default is None that means no limit (type: int)
+
+        :raises ValueError: If memory_budget is less than 0
+        """
+        if memory_budget is not None and memory_budget < 0:
+            raise ValueError("memory_budget must be at least 0")
+        self.memory_budget = memory_budget
+        self.configurations = {}
+        # loaded graphs, from the least to the most recently used
+        self.graphs = OrderedDict()
+        # graphs that are being loaded, with the future of their load
+        self.loading = {}
+        # graphs whose index file is being written, with the event set when it is written
+        self.saving = {}
+        # graph and index versions of the loaded graphs when their index file was read, None if it was not
+        self.file_versions = {}
+        self.statistics = {}
+        self.lock = threading.RLock()
+
+    def register(self, name: str, hashtable_path: str = None, **parameters):
+        """
+        This method register a graph, without connecting to its database.
+
+        :param name: The name of the graph (type: str)
+        :param hashtable_path: The Parquet or Arrow file of the hash-table, it is imported when the graph is loaded if it exists and it is written when the graph is evicted, default is None that means that the hash-table is computed (type: str)
+        :param parameters: The parameters of the AlignmentFreeGraph of the graph
+
+        :raises ValueError: If a graph with the same name is already registered
+        """
+        with self.lock:
+            if name in self.configurations:
+                raise ValueError(f"Graph {name} already registered")
+            self.configurations[name] = (hashtable_path, parameters)
+            self.statistics[name] = {"hits": 0, "loads": 0,
+                                     "evictions": 0, "memory_bytes": 0}
+
+    def unregister(self, name: str):
+        """
+        This method evict a graph, if it is loaded, and remove it from the registry.
+
+        :param name: The name of the graph (type: str)
+        """
+        with self.lock:
+            evicted = self._detach(name) if name in self.graphs else None
+            self.configurations.pop(name)
+            self.statistics.pop(name)
+        if evicted is not None:
+            self._release(*evicted)
+
+    def get(self, name: str):
+        """
+        This method return a graph, it is loaded if it is not loaded and then the least recently used graphs are evicted until the memory is in the budget.
+
+        The graph that is returned is never evicted, also if its index alone is over the budget.
+        The graph is loaded outside the lock, a request of a graph that is being loaded waits for the same load and it is counted as a hit.
+
+        :param name: The name of the graph (type: str)
+
+        :raises KeyError: If the graph is not registered, or if it is unregistered while it is loaded
+
+        :return: The graph (type: AlignmentFreeGraph)
+        """
+        while True:
+            with self.lock:
+                if name not in self.configurations:
+                    raise KeyError(f"Graph {name} not registered")
+                if name in self.graphs:
+                    self.graphs.move_to_end(name)
+                    self.statistics[name]["hits"] += 1
+                    return self.graphs[name]
+
+                # the index file is read only when it is completely written
+                saving = self.saving.get(name)
+                if saving is None:
+                    future = self.loading.get(name)
+                    if future is None:
+                        future = Future()
+                        self.loading[name] = future
+                        configuration = self.configurations[name]
+                    else:
+                        configuration = None
+                    break
+            saving.wait()
+
+        if configuration is None:
+            graph = future.result()
+            with self.lock:
+                if name in self.statistics:
+                    self.statistics[name]["hits"] += 1
+            return graph
+
+        try:
+            graph, imported = self._load(*configuration)
+            memory_bytes = graph.memory_usage()["total"]
+        except BaseException as error:
+            with self.lock:
+                self.loading.pop(name)
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            self.loading.pop(name)
+            if self.configurations.get(name) is not configuration:
+                graph.close_shards()
+                error = KeyError(f"Graph {name} unregistered while loading")
+                future.set_exception(error)
+                raise error
+
+            self.graphs[name] = graph
+            self.file_versions[name] = (graph.graph_version,
+                                        graph.index_version) if imported else None
+            self.statistics[name]["loads"] += 1
+            self.statistics[name]["memory_bytes"] = memory_bytes
+
+            evicted = []
+            while self.memory_budget is not None and len(self.graphs) > 1 and \
+                    self.memory_usage() > self.memory_budget:
+                evicted.append(self._detach(next(iter(self.graphs))))
+        future.set_result(graph)
+        for detached in evicted:
+            self._release(*detached)
+        return graph
+
+    def _load(self, hashtable_path: str, parameters: dict):
+        # the index file is used only if it was computed with the k of the graph
+        graph = AlignmentFreeGraph(**dict(parameters, build_index=False))
+        if hashtable_path is not None and os.path.exists(hashtable_path):
+            graph.import_hashtable(hashtable_path)
+            if "k" not in parameters or graph.k == parameters["k"]:
+                return graph, True
+        graph.compute_hashtable(parameters.get("k"))
+        return graph, False
+
+    def evict(self, name: str):
+        """
+        This method release the index of a loaded graph, it is saved first if the graph has an index file that does not exist or that is older than the graph.
+
+        The index file is older if the graph or its index changed after the file was read, that is if their versions changed.
+        The file is written without holding the lock of the registry.
+
+        :param name: The name of the graph (type: str)
+        """
+        with self.lock:
+            evicted = self._detach(name)
+        self._release(*evicted)
+
+    def _detach(self, name: str):
+        # called with the lock, the graph is removed from the loaded graphs and the save is announced to the requests of the graph
+        graph = self.graphs.pop(name)
+        hashtable_path = self.configurations[name][0]
+        versions = (graph.graph_version, graph.index_version)
+        if hashtable_path is not None and \
+                (not os.path.exists(hashtable_path) or self.file_versions.get(name) != versions):
+            self.saving[name] = threading.Event()
+        else:
+            hashtable_path = None
+        self.file_versions.pop(name, None)
+        self.statistics[name]["evictions"] += 1
+        self.statistics[name]["memory_bytes"] = 0
+        return name, graph, hashtable_path
+
+    def _release(self, name: str, graph: AlignmentFreeGraph, hashtable_path: str = None):
+        # called without the lock, the index is saved if it is needed and the processes of the graph are stopped
+        try:
+            if hashtable_path is not None:
+                graph.export_hashtable(hashtable_path)
+        finally:
+            graph.close_shards()
+            if hashtable_path is not None:
+                with self.lock:
+                    saving = self.saving.pop(name)
+                saving.set()
+
+    def refresh_memory(self, name: str = None):
+        """
+        This method measure again the memory of a loaded graph, for example after its hash-table is computed again.
+
+        :param name: The name of the graph, default is None that means all the loaded graphs (type: str)
+        """
+        with self.lock:
+            names = list(self.graphs) if name is None else [name]
+            for name in names:
+                self.statistics[name]["memory_bytes"] = self.graphs[name].memory_usage()[
+                    "total"]
+
+    def memory_usage(self):
+        """
+        This method return the memory of the loaded indexes, as measured when they were loaded or refreshed.
+
+        :return: The memory in bytes (type: int)
+        """
+        with self.lock:
+            return sum(self.statistics[name]["memory_bytes"] for name in self.graphs)
+
+    def stats(self):
+        """
+        This method return the statistics of the registry.
+
+        :return: The memory budget, the memory used and, for every graph, if it is loaded or being loaded, its memory and its hits, loads and evictions (type: dict)
+        """
+        with self.lock:
+            return {
+                "memory_budget": self.memory_budget,
+                "memory_bytes": self.memory_usage(),
+                "graphs": {name: dict(statistics, loaded=name in self.graphs, loading=name in self.loading)
+                           for name, statistics in self.statistics.items()}
+            }
+
+    def close(self):
+        """
+        This method evict all the loaded graphs.
+        """
+        with self.lock:
+            evicted = [self._detach(name) for name in list(self.graphs)]
+        for detached in evicted:
+            self._release(*detached)
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+def mix64(values: np.ndarray):
+    """
+    This function hash an array of 64-bit integers with the finalizer of SplitMix64, so that all the bits of the result depend on all the bits of the value.
+
+    :param values: The values (type: numpy.ndarray)
+
+    :return: The hashes of the values (type: numpy.ndarray of uint64)
+    """
+    values = values.astype(np.uint64)
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * \
+        np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * \
+        np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def leading_zeros(values: np.ndarray):
+    """
+    This function count the leading zeros of an array of 64-bit integers, 64 for the zeros.
+
+    :param values: The values (type: numpy.ndarray of uint64)
+
+    :return: The number of leading zeros of every value (type: numpy.ndarray)
+    """
+    values = values.astype(np.uint64)
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        # the values with the highest shift bits empty are moved up
+        empty = values < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[empty] += shift
+        values[empty] <<= np.uint64(shift)
+    zeros[values == 0] += 1
+    return zeros
+
+
+class HyperLogLog:
+
+    """
+    HyperLogLog sketch, an estimate of the number of distinct items in a fixed memory.
+
+    The items are added as 64-bit hashes, the relative error of the estimate is about 1.04 / sqrt(2 ** precision).
+    """
+
+    def __init__(self, precision: int = 12):
+        """
+        HyperLogLog constructor
+
+        :param precision: The number of bits of the hash that choose the register, there are 2 ** precision registers, default is 12 (type: int)
+
+        :raises ValueError: If precision is not between 4 and 18
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """
+        This method add the items with the given hashes.
+
+        :param hashes: The 64-bit hashes of the items (type: numpy.ndarray of uint64)
+        """
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes << np.uint64(self.precision)
+        rank = np.minimum(leading_zeros(rest), 64 -
+                          self.precision) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        """
+        This method add the items of another sketch with the same precision.
+
+        :raises ValueError: If the precisions are different
+        """
+        if other.precision != self.precision:
+            raise ValueError("precision must be the same")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        """
+        This method estimate the number of distinct items added.
+
+        :return: The estimated number of distinct items (type: float)
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / \
+            np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        empty = np.count_nonzero(self.registers == 0)
+        # linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * m and empty > 0:
+            return float(m * np.log(m / empty))
+        return float(estimate)
+
+    def memory_usage(self):
+        """
+        This method return the memory used by the registers.
+
+        :return: The size of the sketch in bytes (type: int)
+        """
+        return self.registers.nbytes
@@ -0,0 +1,35 @@
+import weakref
+
+
+class IndexSnapshot:
+
+    """
+    Snapshot of the index of a graph: the hash-table, its Bloom filter and the k parameter and the canonical mode used to compute them.
+
+    A snapshot is never changed after it is published, only its DataFrame is computed when it is first requested.
+    A reader takes the current snapshot once and uses only it, so it never sees a hash-table that is being built or updated and it does not need a lock.
+    A writer builds a new snapshot and publishes it by replacing the reference, the old snapshot is freed when its last reader drops it, with the processes of its hash-table if it is sharded.
+    """
+
+    __slots__ = ("hashtable", "bloom_filter", "k",
+                 "canonical", "version", "hashtable_df", "__weakref__")
+
+    def __init__(self, hashtable, bloom_filter=None, k: int = 3, canonical: bool = False, version: int = 0):
+        """
+        Index snapshot constructor
+
+        :param hashtable: The hash-table, a dictionary, a ShardedHashtable or an OverlayHashtable (type: Mapping)
+        :param bloom_filter: The Bloom filter of the k-mers of the hash-table, default is None (type: BloomFilter)
+        :param k: The k parameter of the hash-table, default is 3 (type: int)
+        :param canonical: If True the k-mers of the hash-table are canonical, default is False (type: bool)
+        :param version: The version of the index, it changes with every snapshot published, default is 0 (type: int)
+        """
+        self.hashtable = hashtable
+        self.bloom_filter = bloom_filter
+        self.k = k
+        self.canonical = canonical
+        self.version = version
+        # computed when it is requested, from this snapshot only
+        self.hashtable_df = None
+        if hasattr(hashtable, "close"):
+            weakref.finalize(self, hashtable.close)
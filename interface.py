@@ -1,5 +1,8 @@
 import customtkinter as ctk
+import bisect
 import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk
 import tkinter.font as tkFont
@@ -14,15 +17,28 @@ from alignmentfreegraph import AlignmentFreeGraph
 plt.rcParams['figure.figsize'] = [16, 9]
 plt.rcParams['figure.dpi'] = 80
 
+HASH_TABLE_PAGE_SIZE = 100
+HASH_TABLE_WIDTH_SAMPLE = 200
+
 # Variables
 afg = None
 selected_file = None
 hash_table = None
+hash_table_index = None
+hash_table_rows = None
+hash_table_page = 0
 fig = None
+worker = None
+worker_cancel = threading.Event()
+worker_queue = queue.Queue()
 
 # Functions
 
 
+class OperationCancelled(Exception):
+    pass
+
+
 def is_valid_color(color_str):
     try:
         mcolors.to_rgba(color_str)
@@ -80,7 +96,7 @@ def chose_file_image():
 
 def chose_file_hahstable():
     filename = filedialog.asksaveasfile(initialdir=os.getcwd(), title="Select file", defaultextension=".json", initialfile="hash_table.json",
-                                        filetypes=[("JSON files", "*.json"), ("Excel file", "*.xlsx"), ("CSV files", "*.csv"), ("all files", "*.*")])
+                                        filetypes=[("JSON files", "*.json"), ("Parquet files", "*.parquet"), ("Arrow files", "*.arrow"), ("Excel file", "*.xlsx"), ("CSV files", "*.csv"), ("all files", "*.*")])
     return filename.name
 
 
@@ -249,42 +265,218 @@ def new_connection(message: str = "Create a conection", error: str = None):
     login_button.pack(pady=30)
 
 
-def show_hashtable():
+def load_hashtable(progress=None):
+    # the DataFrame and its index are built on the worker thread, only the widgets are built on the Tk main thread
+    hashtable = afg.get_hashtable_df()
+    return hashtable, build_hashtable_index(hashtable)
+
+
+def build_hashtable_index(hashtable):
+    # sorted k-mers for prefix search and row positions grouped by start node
+    if len(hashtable) == 0:
+        return {"kmers": [], "order": [], "starts": {}}
+    kmers = hashtable["Kmer"].tolist()
+    order = sorted(range(len(kmers)), key=kmers.__getitem__)
+    starts = {int(start): rows for start, rows in
+              hashtable.groupby("start").indices.items()}
+    return {"kmers": [kmers[i] for i in order], "order": order, "starts": starts}
+
+
+def filter_hashtable_rows(prefix: str = "", start: int = None):
+    global hash_table_index
+    rows = None
+    if prefix != "":
+        kmers = hash_table_index["kmers"]
+        lo = bisect.bisect_left(kmers, prefix)
+        hi = bisect.bisect_left(kmers, prefix + chr(0x10FFFF), lo)
+        rows = hash_table_index["order"][lo:hi]
+    if start is not None:
+        start_rows = hash_table_index["starts"].get(start, [])
+        if rows is None:
+            rows = list(start_rows)
+        else:
+            start_rows = set(start_rows)
+            rows = [row for row in rows if row in start_rows]
+    if rows is None:
+        rows = range(len(hash_table_index["order"]))
+    return rows
+
+
+def apply_hashtable_filter(event=None):
+    global hash_table_rows
+    global hash_table_page
+    prefix = hash_table_prefix_entry.get().strip().upper()
+    start = hash_table_start_entry.get().strip()
+    if start != "" and not is_int(start):
+        hash_table_page_label.configure(text=f"{start} not a node")
+        return
+    start = int(start) if start != "" else None
+    hash_table_rows = filter_hashtable_rows(prefix, start)
+    hash_table_page = 0
+    show_hashtable_page()
+
+
+def change_hashtable_page(step: int):
+    global hash_table_page
+    n_pages = max(1, -(-len(hash_table_rows) // HASH_TABLE_PAGE_SIZE))
+    hash_table_page = min(max(hash_table_page + step, 0), n_pages - 1)
+    show_hashtable_page()
+
+
+def show_hashtable_page():
+    global hash_table
+    hashtable = hash_table
+    hash_table_tree.delete(*hash_table_tree.get_children())
+
+    first = hash_table_page * HASH_TABLE_PAGE_SIZE
+    rows = list(hash_table_rows[first:first + HASH_TABLE_PAGE_SIZE])
+    # only the rows of the current page are materialized in the treeview
+    if len(rows) > 0:
+        for row in hashtable.iloc[rows].itertuples(index=False):
+            hash_table_tree.insert("", tk.END, values=tuple(row))
+
+    n_pages = max(1, -(-len(hash_table_rows) // HASH_TABLE_PAGE_SIZE))
+    hash_table_page_label.configure(
+        text=f"{hash_table_page + 1}/{n_pages} ({len(hash_table_rows)} rows)")
+
+
+def show_hashtable(loaded=None):
     global afg
+    global hash_table
+    global hash_table_index
+    global hash_table_rows
+    global hash_table_page
+    global hash_table_tree
+    global hash_table_prefix_entry
+    global hash_table_start_entry
+    global hash_table_page_label
 
-    # Create a treeview for the hashtable
     for widget in hash_table_frame.winfo_children():
         widget.destroy()
-    tree = ttk.Treeview(
-        hash_table_frame, selectmode='browse', show='headings')
 
-    # Assuming hashtable is a dictionary
-    # Replace with your method to get the hashtable
-    hashtable = afg.get_hashtable_df()
+    if loaded is None:
+        loaded = load_hashtable()
+    hash_table, hash_table_index = loaded
+    hashtable = hash_table
+    hash_table_rows = range(len(hashtable))
+    hash_table_page = 0
+
+    # Filters by k-mer prefix and start node
+    filter_frame = ctk.CTkFrame(master=hash_table_frame)
+    hash_table_prefix_entry = ctk.CTkEntry(
+        master=filter_frame, placeholder_text="K-mer prefix", width=100)
+    hash_table_start_entry = ctk.CTkEntry(
+        master=filter_frame, placeholder_text="Start node", width=80)
+    hash_table_prefix_entry.bind("<Return>", apply_hashtable_filter)
+    hash_table_start_entry.bind("<Return>", apply_hashtable_filter)
+    filter_button = ctk.CTkButton(
+        master=filter_frame, text="Filter", width=60, command=apply_hashtable_filter)
+    hash_table_prefix_entry.pack(side="left", padx=3)
+    hash_table_start_entry.pack(side="left", padx=3)
+    filter_button.pack(side="left", padx=3)
+    filter_frame.pack(fill="x", pady=3)
+
+    # Create a treeview for the hashtable
+    hash_table_tree = ttk.Treeview(
+        hash_table_frame, selectmode='browse', show='headings', height=HASH_TABLE_PAGE_SIZE // 5)
 
     # Create the columns
     columns = tuple(hashtable.columns)
 
-    tree["columns"] = columns
-    tree.column("#0", width=0, stretch=ctk.NO)
+    hash_table_tree["columns"] = columns
+    hash_table_tree.column("#0", width=0, stretch=ctk.NO)
+    font = tkFont.Font()
+    sample = hashtable.head(HASH_TABLE_WIDTH_SAMPLE)
     for col in columns:
-        # Calculate the maximum width needed for the column content
-        max_width = max([tree.heading(col)["text"], *[str(value)
-                        for value in hashtable[col]]], key=len)
-        # Set column width to the maximum width
-        tree.column(col, width=tkFont.Font().measure(
+        # Estimate the width needed for the column content from a sample of rows
+        max_width = max([col, *[str(value) for value in sample[col]]], key=len)
+        hash_table_tree.column(col, width=font.measure(
             max_width) + 20, anchor="w")
 
     # Create the headings
-    tree.heading("#0", text="", anchor=ctk.W)
+    hash_table_tree.heading("#0", text="", anchor=ctk.W)
     for col in columns:
-        tree.heading(col, text=col, anchor=ctk.W)
-
-    # Add the data from the hashtable
-    for index, row in hashtable.iterrows():
-        tree.insert("", tk.END, values=tuple(row))
-
-    tree.pack(expand=True, fill="both")
+        hash_table_tree.heading(col, text=col, anchor=ctk.W)
+
+    hash_table_tree.pack(expand=True, fill="both")
+
+    # Pages of the hashtable
+    page_frame = ctk.CTkFrame(master=hash_table_frame)
+    previous_button = ctk.CTkButton(
+        master=page_frame, text="<", width=30, command=lambda: change_hashtable_page(-1))
+    hash_table_page_label = ctk.CTkLabel(master=page_frame, text="")
+    next_button = ctk.CTkButton(
+        master=page_frame, text=">", width=30, command=lambda: change_hashtable_page(1))
+    previous_button.pack(side="left", padx=3)
+    hash_table_page_label.pack(side="left", padx=3, expand=True)
+    next_button.pack(side="right", padx=3)
+    page_frame.pack(fill="x", pady=3)
+
+    show_hashtable_page()
+
+
+def report_progress(message: str, percent: int = None):
+    # called from the worker thread, the cancellation is checked at every report
+    if worker_cancel.is_set():
+        raise OperationCancelled()
+    worker_queue.put(("progress", message, percent))
+
+
+def run_in_background(task, on_done, message: str):
+    """
+    Run task(report_progress) on a worker thread, on_done(result) is then called on the Tk main thread.
+    """
+    global worker
+    if worker is not None and worker.is_alive():
+        worker_status_label.configure(text="Wait for the running operation")
+        return
+
+    def target():
+        try:
+            worker_queue.put(("done", on_done, task(report_progress)))
+        except OperationCancelled:
+            worker_queue.put(("cancelled", None, None))
+        except Exception as e:
+            worker_queue.put(("error", e, None))
+
+    worker_cancel.clear()
+    worker_status_label.configure(text=message)
+    worker_progress_bar.set(0)
+    worker_cancel_button.configure(state="normal")
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    root.after(100, poll_worker)
+
+
+def poll_worker():
+    # results are posted on the queue by the worker and consumed only here, on the Tk main thread
+    while True:
+        try:
+            kind, value, extra = worker_queue.get_nowait()
+        except queue.Empty:
+            break
+        if kind == "progress":
+            worker_status_label.configure(text=value)
+            if extra is not None:
+                worker_progress_bar.set(extra / 100)
+        elif kind == "done":
+            worker_status_label.configure(text="")
+            worker_progress_bar.set(1)
+            worker_cancel_button.configure(state="disabled")
+            value(extra)
+        elif kind == "cancelled":
+            worker_status_label.configure(text="Cancelled")
+            worker_cancel_button.configure(state="disabled")
+        else:
+            worker_status_label.configure(text=f"Error: {value}")
+            worker_cancel_button.configure(state="disabled")
+    if worker is not None and (worker.is_alive() or not worker_queue.empty()):
+        root.after(100, poll_worker)
+
+
+def cancel_worker():
+    worker_cancel.set()
+    worker_status_label.configure(text="Cancelling...")
 
 
 def change_k(event):
@@ -294,9 +486,14 @@ def change_k(event):
     if feasible_k():
         k = int(k)
         if k != afg.get_k():
-            afg.set_k(k)
-            show_hashtable()
-            k_value_problem_label.configure(text="")
+            def task(progress):
+                afg.set_k(k, progress=progress)
+                return load_hashtable(progress)
+
+            def done(result):
+                show_hashtable(result)
+                k_value_problem_label.configure(text="")
+            run_in_background(task, done, f"Computing hash-table with k = {k}")
     else:
         k_value_entry.delete(0, tk.END)
         k_value_entry.insert(0, str(afg.get_k()))
@@ -325,9 +522,11 @@ def search_sequence():
     global sequence_result_label
     sequence = sequence_entry.get()
     if sequence != "":
-        result = afg.sequence_from_graph(sequence)
-        if result is not None:
-            sequence_result_label.configure(text="Result: " + str(result))
+        def done(result):
+            if result is not None:
+                sequence_result_label.configure(text="Result: " + str(result))
+        run_in_background(lambda progress: afg.sequence_from_graph(
+            sequence, progress=progress), done, "Searching sequence")
     else:
         sequence_result_label.configure(text="Result: ")
 
@@ -336,19 +535,23 @@ def add_from_file():
     global afg
     file = open_file_dialog_json_gfa()
     if file is not None:
-        if file.endswith(".gfa"):
-            afg.upload_from_gfa(file)
-        elif file.endswith(".json"):
-            afg.upload_from_json(file)
-        plot_graph()
-        show_hashtable()
+        def upload(progress):
+            if file.endswith(".gfa"):
+                afg.upload_from_gfa(file, progress=progress)
+            elif file.endswith(".json"):
+                afg.upload_from_json(file, progress=progress)
+            return load_hashtable(progress)
+        run_in_background(upload, lambda result: (plot_graph(), show_hashtable(result)),
+                          "Uploading " + file.split("/")[-1])
 
 
 def delete_all_nodes():
     global afg
-    afg.delete_all()
-    plot_graph()
-    show_hashtable()
+    def delete(progress):
+        afg.delete_all(progress=progress)
+        return load_hashtable(progress)
+    run_in_background(delete, lambda result: (plot_graph(), show_hashtable(result)),
+                      "Deleting all nodes")
 
 
 def change_connection():
@@ -357,7 +560,7 @@ def change_connection():
 
     k_value_entry.insert(0, str(afg.get_k()))
     plot_graph()
-    show_hashtable()
+    run_in_background(load_hashtable, show_hashtable, "Loading hash-table")
 
 
 def export_graph():
@@ -445,9 +648,21 @@ add_from_file_button = ctk.CTkButton(
     master=option_graph_frame, text="Add from file", command=add_from_file, fg_color="#2ecc71", hover_color="#27ae60")
 add_from_file_button.pack(side="left", pady=5, padx=10)
 
+worker_frame = ctk.CTkFrame(master=frame)
+worker_frame.pack(side="top", anchor="n", pady=5, padx=15,
+                  expand=True, after=option_graph_frame)
+worker_status_label = ctk.CTkLabel(master=worker_frame, text="")
+worker_status_label.pack(side="left", pady=5, padx=10)
+worker_progress_bar = ctk.CTkProgressBar(master=worker_frame, width=150)
+worker_progress_bar.set(0)
+worker_progress_bar.pack(side="left", pady=5, padx=10)
+worker_cancel_button = ctk.CTkButton(
+    master=worker_frame, text="Cancel", command=cancel_worker, state="disabled", fg_color="#df2c14", hover_color="#c61a09")
+worker_cancel_button.pack(side="left", pady=5, padx=10)
+
 export_frame = ctk.CTkFrame(master=frame)
 export_frame.pack(side="top", anchor="n", pady=10, padx=15,
-                  expand=True, after=option_graph_frame)
+                  expand=True, after=worker_frame)
 export_graph_button = ctk.CTkButton(master=export_frame, text="Export Graph",
                                     command=export_graph, fg_color="#24a0ed", hover_color="#1183ca")
 export_graph_button.pack(side="left", pady=5, padx=10, expand=True)
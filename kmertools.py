@@ -0,0 +1,129 @@
+import re
+
+import numpy as np
+
+COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+
+# 2-bit code of every byte, 4 for the characters that are not bases
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate(b"ACGT"):
+    BASE_CODES[base] = code
+    BASE_CODES[base + 32] = code
+
+# a character that is not a base
+NOT_BASE = re.compile("[^ACGT]")
+
+
+def reverse_complement(kmer: str):
+    """
+    This function return the reverse complement of a k-mer, the characters that are not bases are kept as they are.
+
+    :param kmer: The k-mer (type: str)
+
+    :return: The reverse complement of the k-mer (type: str)
+    """
+    return kmer.translate(COMPLEMENT)[::-1]
+
+
+def canonical_kmer(kmer: str):
+    """
+    This function return the canonical form of a k-mer, that is the smallest between the k-mer and its reverse complement.
+
+    :param kmer: The k-mer (type: str)
+
+    :return: The canonical k-mer and its strand, "+" if it is the k-mer itself (also for palindromes) and "-" if it is the reverse complement (type: tuple)
+    """
+    reverse = reverse_complement(kmer)
+    if reverse < kmer:
+        return reverse, "-"
+    return kmer, "+"
+
+
+def encode_sequence(sequence: str):
+    """
+    This function encode a sequence in a buffer of bytes, once for all its k-mers.
+
+    The sequence is converted to upper case and the spaces are removed.
+
+    :param sequence: The sequence (type: str)
+
+    :return: The bytes of the sequence and their 2-bit codes, 4 for the characters that are not bases (type: tuple of numpy.ndarray)
+    """
+    buffer = np.frombuffer(sequence.encode("ascii", "replace").upper().replace(b" ", b""),
+                           dtype=np.uint8)
+    return buffer, BASE_CODES[buffer]
+
+
+def kmer_codes(codes: np.ndarray, k: int, step: int = 1):
+    """
+    This function compute the 2-bit code of every k-mer of an encoded sequence, for the callers that use the k-mers as integers.
+
+    The codes of all the windows are computed at once with k vectorized passes, one base of every window at a time, the order of the codes is the same of the k-mers.
+
+    :param codes: The 2-bit codes of the sequence, see encode_sequence (type: numpy.ndarray)
+    :param k: The k parameter, at most 32 (type: int)
+    :param step: The distance between two k-mers, 1 for overlapping k-mers and k for consecutive ones, default is 1 (type: int)
+
+    :raises ValueError: If k is greater than 32
+
+    :return: The codes of the k-mers and the mask of the k-mers that contain only bases (type: tuple of numpy.ndarray)
+    """
+    if k > 32:
+        raise ValueError("k must be at most 32")
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+
+    invalid = np.concatenate(([0], np.cumsum(codes > 3)))
+    mask = (invalid[k:] - invalid[:-k]) == 0
+
+    values = np.where(codes > 3, 0, codes).astype(np.uint64)
+    kmers = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        kmers = (kmers << np.uint64(2)) | values[j:j + n]
+    return kmers[::step], mask[::step]
+
+
+def normalize_sequence(sequence: str):
+    """
+    This function convert a sequence to upper case and remove its spaces, the sequences are normalized once, before their k-mers are extracted.
+
+    :param sequence: The sequence (type: str)
+
+    :return: The normalized sequence (type: str)
+    """
+    return sequence.upper().replace(" ", "")
+
+
+def extract_kmers(sequence: str, k: int, step: int = 1, canonical: bool = False):
+    """
+    This function extract the k-mers of a sequence.
+
+    The k-mers are sliced from the sequence, the sequence is scanned once for characters that are not bases and only the k-mers of a sequence that has some are checked one by one.
+
+    :param sequence: The sequence, normalized with normalize_sequence (type: str)
+    :param k: The k parameter (type: int)
+    :param step: The distance between two k-mers, 1 for overlapping k-mers and k for consecutive ones, default is 1 (type: int)
+    :param canonical: If True the k-mers are replaced by their canonical form, default is False (type: bool)
+
+    :return: The k-mers, if every k-mer contains only bases (A, C, G, T) and the strands of the k-mers, "+" if the k-mer is canonical or canonical is False (type: tuple of lists)
+    """
+    starts = range(0, len(sequence) - k + 1, step)
+    kmers = [sequence[i:i + k] for i in starts]
+
+    if NOT_BASE.search(sequence) is None:
+        mask = [True] * len(kmers)
+    else:
+        mask = [NOT_BASE.search(kmer) is None for kmer in kmers]
+
+    strands = ["+"] * len(kmers)
+    if canonical:
+        # the reverse complement of the k-mer at i is at len(sequence) - i - k in the reverse complement of the sequence
+        reverse = sequence.translate(COMPLEMENT)[::-1]
+        end = len(sequence) - k
+        for j, i in enumerate(starts):
+            kmer = reverse[end - i:end - i + k]
+            if kmer < kmers[j]:
+                kmers[j] = kmer
+                strands[j] = "-"
+    return kmers, mask, strands
@@ -0,0 +1,65 @@
+from collections.abc import Mapping
+
+
+class OverlayHashtable(Mapping):
+
+    """
+    Hash-table made of a base hash-table, that is never changed, and of the k-mers changed and removed after it.
+
+    It is used to update a few k-mers of a published hash-table without copying it, the base is shared with the snapshots that use it.
+    An overlay of an overlay uses the same base, and when the changes are more than a fraction of the base they are merged in a new dictionary.
+    """
+
+    def __init__(self, base: Mapping, changes: dict = None, removed: set = None, max_ratio: float = 0.25):
+        """
+        Overlay hash-table constructor
+
+        :param base: The base hash-table, if it is an overlay its base and its changes are used (type: Mapping)
+        :param changes: The k-mers added or changed, with their values, default is None (type: dict)
+        :param removed: The k-mers removed, default is None (type: set)
+        :param max_ratio: The maximum number of changes, as a fraction of the size of the base, before they are merged, default is 0.25 (type: float)
+        """
+        changes = {} if changes is None else dict(changes)
+        removed = set() if removed is None else set(removed)
+        if isinstance(base, OverlayHashtable):
+            changes = {**{kmer: value for kmer, value in base.changes.items() if kmer not in removed},
+                       **changes}
+            removed = (base.removed | removed) - changes.keys()
+            base = base.base
+        else:
+            removed -= changes.keys()
+
+        if len(changes) + len(removed) > max_ratio * len(base):
+            base = dict(base)
+            for kmer in removed:
+                base.pop(kmer, None)
+            base.update(changes)
+            changes = {}
+            removed = set()
+
+        self.base = base
+        self.changes = changes
+        self.removed = removed
+        self.max_ratio = max_ratio
+        self.n_items = len(base) + \
+            sum(1 for kmer in changes if kmer not in base) - \
+            sum(1 for kmer in removed if kmer in base)
+
+    def __getitem__(self, kmer: str):
+        if kmer in self.changes:
+            return self.changes[kmer]
+        if kmer in self.removed:
+            raise KeyError(kmer)
+        return self.base[kmer]
+
+    def __contains__(self, kmer: str):
+        return kmer in self.changes or (kmer not in self.removed and kmer in self.base)
+
+    def __iter__(self):
+        for kmer in self.base:
+            if kmer not in self.removed and kmer not in self.changes:
+                yield kmer
+        yield from self.changes
+
+    def __len__(self):
+        return self.n_items
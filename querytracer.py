@@ -0,0 +1,191 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# string literals and numbers that are not part of a name, they are replaced by ? in the templates
+LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|(?<![\w$.])-?\d+(?:\.\d+)?(?![\w.])")
+SPACES = re.compile(r"\s+")
+
+
+class QueryTracer:
+
+    """
+    Statistics of the queries executed on a database.
+
+    The queries are grouped by template, that is the query without literals, and for every template it counts the executions, the rows, the size of the parameters and the time with an histogram.
+    The queries slower than a threshold are logged and kept, and a sample of the queries can be executed with PROFILE to keep their plan.
+    """
+
+    # upper bounds in seconds of the buckets of the histograms, the last bucket has no bound
+    BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0)
+
+    def __init__(self, slow_threshold: float = 1.0, profile_rate: float = 0.0, max_slow_queries: int = 100):
+        """
+        Query tracer constructor
+
+        :param slow_threshold: The time in seconds over which a query is logged as slow, default is 1.0 (type: float)
+        :param profile_rate: The fraction of the queries executed with PROFILE, default is 0.0 (type: float)
+        :param max_slow_queries: The number of the last slow queries that are kept, default is 100 (type: int)
+
+        :raises ValueError: If profile_rate is not between 0 and 1
+        """
+        if not 0 <= profile_rate <= 1:
+            raise ValueError("profile_rate must be between 0 and 1")
+        self.slow_threshold = slow_threshold
+        self.profile_rate = profile_rate
+        self.templates = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def template(query: str):
+        """
+        This method return the template of a query, the literals are replaced by ? and the spaces are collapsed.
+
+        :param query: The query (type: str)
+
+        :return: The template of the query (type: str)
+        """
+        return SPACES.sub(" ", LITERAL.sub("?", query)).strip()
+
+    def should_profile(self, query: str):
+        """
+        This method choose if a query is executed with PROFILE, the queries that already have a plan and the schema commands are never profiled.
+
+        :param query: The query (type: str)
+
+        :return: True if the query must be profiled (type: bool)
+        """
+        if self.profile_rate == 0:
+            return False
+        words = query.split(None, 2)
+        if len(words) == 0 or words[0].upper() in ("PROFILE", "EXPLAIN", "SHOW"):
+            return False
+        if words[0].upper() in ("CREATE", "DROP") and len(words) > 1 and words[1].upper() in ("INDEX", "CONSTRAINT"):
+            return False
+        return random.random() < self.profile_rate
+
+    def record(self, query: str, parameters: dict, rows: int, seconds: float, plan=None):
+        """
+        This method record an execution of a query.
+
+        :param query: The query (type: str)
+        :param parameters: The parameters of the query (type: dict)
+        :param rows: The number of rows read from the result (type: int)
+        :param seconds: The time of the execution (type: float)
+        :param plan: The plan of the query if it was profiled, default is None (type: dict)
+        """
+        template = self.template(query)
+        parameters_size = len(json.dumps(parameters, default=str)
+                              ) if parameters else 0
+        bucket = 0
+        while bucket < len(self.BUCKETS) and seconds > self.BUCKETS[bucket]:
+            bucket += 1
+
+        with self.lock:
+            stats = self.templates.get(template)
+            if stats is None:
+                stats = {"count": 0, "rows": 0, "parameters_size": 0, "total_time": 0.0,
+                         "max_time": 0.0, "histogram": [0] * (len(self.BUCKETS) + 1), "plan": None}
+                self.templates[template] = stats
+            stats["count"] += 1
+            stats["rows"] += rows
+            stats["parameters_size"] += parameters_size
+            stats["total_time"] += seconds
+            stats["max_time"] = max(stats["max_time"], seconds)
+            stats["histogram"][bucket] += 1
+            if plan is not None:
+                stats["plan"] = plan
+            if seconds >= self.slow_threshold:
+                self.slow_queries.append({"template": template, "rows": rows, "parameters_size": parameters_size,
+                                          "time": seconds, "timestamp": time.time()})
+
+        if seconds >= self.slow_threshold:
+            logger.warning("Slow query (%.3f s, %d rows): %s",
+                           seconds, rows, template)
+
+    def stats(self):
+        """
+        This method return the statistics of the queries.
+
+        :return: The bounds of the buckets, the statistics of every template sorted by total time and the last slow queries (type: dict)
+        """
+        with self.lock:
+            templates = [dict(stats, template=template, histogram=list(stats["histogram"]),
+                              mean_time=stats["total_time"] / stats["count"])
+                         for template, stats in self.templates.items()]
+            slow_queries = list(self.slow_queries)
+        templates.sort(key=lambda stats: stats["total_time"], reverse=True)
+        return {"buckets": list(self.BUCKETS), "templates": templates, "slow_queries": slow_queries}
+
+    def reset(self):
+        """
+        This method delete the statistics of the queries.
+        """
+        with self.lock:
+            self.templates = {}
+            self.slow_queries.clear()
+
+    def export_json(self, file_path: str):
+        """
+        This method export the statistics of the queries in a JSON file.
+
+        :param file_path: Path of the file
+        """
+        with open(file_path, 'w') as f:
+            json.dump(self.stats(), f, indent=4, default=str)
+
+
+class TracedCursor:
+
+    """
+    Result of a query that is recorded in a QueryTracer when it is read to the end or closed.
+
+    Only the time spent in the database and in reading the rows is counted, not the time of the code that uses the rows.
+    """
+
+    def __init__(self, cursor, tracer: QueryTracer, query: str, parameters: dict, seconds: float, profiled: bool = False):
+        self.cursor = cursor
+        self.tracer = tracer
+        self.query = query
+        self.parameters = parameters
+        self.seconds = seconds
+        self.profiled = profiled
+        self.rows = 0
+        self.recorded = False
+
+    def _record(self):
+        if not self.recorded:
+            self.recorded = True
+            plan = self.cursor.plan() if self.profiled else None
+            self.tracer.record(self.query, self.parameters,
+                               self.rows, self.seconds, plan)
+
+    def __iter__(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    record = next(self.cursor)
+                except StopIteration:
+                    return
+                finally:
+                    self.seconds += time.perf_counter() - start
+                self.rows += 1
+                yield record
+        finally:
+            self._record()
+
+    def data(self):
+        start = time.perf_counter()
+        data = self.cursor.data()
+        self.seconds += time.perf_counter() - start
+        self.rows += len(data)
+        self._record()
+        return data
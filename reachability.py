@@ -0,0 +1,165 @@
+import random
+
+import numpy as np
+
+
+class ReachabilityIndex:
+
+    """
+    Reachability index of a directed acyclic graph, it answers if a node can be reached from another one without traversing the graph in most cases.
+
+    Every node has its topological level, the length of the longest path that reaches it, and an interval for each of some random depth-first traversals, the interval of a node contains the intervals of all the nodes that it reaches.
+    If the levels or one of the intervals exclude the reachability the answer is immediate, otherwise a depth-first search pruned by the same labels gives the answer.
+    """
+
+    def __init__(self, successors: dict, n_traversals: int = 3, seed: int = 0):
+        """
+        Reachability index constructor
+
+        :param successors: The successors of every node of the graph (type: dict of lists)
+        :param n_traversals: The number of random traversals, more traversals exclude more pairs but the index is larger, default is 3 (type: int)
+        :param seed: The seed of the random order of the traversals, default is 0 (type: int)
+
+        :raises ValueError: If the graph is not acyclic or if n_traversals is less than 1
+        """
+        if n_traversals < 1:
+            raise ValueError("n_traversals must be greater than 0")
+
+        nodes = set(successors)
+        for next_nodes in successors.values():
+            nodes.update(next_nodes)
+        self.nodes = {node: i for i, node in enumerate(nodes)}
+        n = len(self.nodes)
+        self.successors = [[] for _ in range(n)]
+        for node, next_nodes in successors.items():
+            self.successors[self.nodes[node]] = sorted(
+                set(self.nodes[next_node] for next_node in next_nodes))
+
+        # topological levels with the Kahn algorithm
+        in_degree = np.zeros(n, dtype=np.int64)
+        for next_nodes in self.successors:
+            for next_node in next_nodes:
+                in_degree[next_node] += 1
+        self.levels = np.zeros(n, dtype=np.int64)
+        order = [i for i in range(n) if in_degree[i] == 0]
+        for i in order:
+            for next_node in self.successors[i]:
+                self.levels[next_node] = max(
+                    self.levels[next_node], self.levels[i] + 1)
+                in_degree[next_node] -= 1
+                if in_degree[next_node] == 0:
+                    order.append(next_node)
+        if len(order) < n:
+            raise ValueError("Graph must be acyclic")
+
+        generator = random.Random(seed)
+        self.low = np.zeros((n_traversals, n), dtype=np.int64)
+        self.post = np.zeros((n_traversals, n), dtype=np.int64)
+        for t in range(n_traversals):
+            self._traverse(t, order, generator)
+
+    def _traverse(self, t: int, order: list, generator: random.Random):
+        # iterative post-order traversal, from the sources in random order and with the children in random order
+        low = self.low[t]
+        post = self.post[t]
+        visited = np.zeros(len(self.successors), dtype=bool)
+        counter = 0
+        roots = [i for i in order if self.levels[i] == 0]
+        generator.shuffle(roots)
+        for root in roots:
+            children = list(self.successors[root])
+            generator.shuffle(children)
+            stack = [(root, children)]
+            visited[root] = True
+            low[root] = len(self.successors)
+            while len(stack) > 0:
+                node, children = stack[-1]
+                if len(children) > 0:
+                    child = children.pop()
+                    if not visited[child]:
+                        visited[child] = True
+                        low[child] = len(self.successors)
+                        grandchildren = list(self.successors[child])
+                        generator.shuffle(grandchildren)
+                        stack.append((child, grandchildren))
+                    else:
+                        low[node] = min(low[node], low[child])
+                    continue
+                stack.pop()
+                post[node] = counter
+                low[node] = min(low[node], counter)
+                counter += 1
+                if len(stack) > 0:
+                    parent = stack[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _excluded(self, a: int, b: int):
+        # True if the labels prove that b is not reachable from a
+        if self.levels[a] >= self.levels[b]:
+            return True
+        return bool(np.any((self.low[:, b] < self.low[:, a]) | (self.post[:, b] > self.post[:, a])))
+
+    def reachable(self, a, b):
+        """
+        This method check if a node can be reached from another one, a node reaches itself.
+
+        :param a: The id of the first node
+        :param b: The id of the second node
+
+        :raises KeyError: If a node is not in the graph
+
+        :return: True if there is a path from a to b (type: bool)
+        """
+        return self._reachable(self.nodes[a], self.nodes[b])
+
+    def _reachable(self, a: int, b: int):
+        if a == b:
+            return True
+        if self._excluded(a, b):
+            return False
+
+        # depth-first search where the nodes that cannot reach b are not visited
+        stack = [a]
+        visited = {a}
+        while len(stack) > 0:
+            node = stack.pop()
+            for next_node in self.successors[node]:
+                if next_node == b:
+                    return True
+                if next_node not in visited and not self._excluded(next_node, b):
+                    visited.add(next_node)
+                    stack.append(next_node)
+        return False
+
+    def reachable_many(self, pairs):
+        """
+        This method check the reachability of many pairs of nodes, the pairs excluded by the levels and by the intervals are checked at once.
+
+        :param pairs: The (a, b) pairs of node ids (type: iterable of tuples)
+
+        :raises KeyError: If a node is not in the graph
+
+        :return: For every pair, True if there is a path from a to b (type: list of bool)
+        """
+        pairs = [(self.nodes[a], self.nodes[b]) for a, b in pairs]
+        if len(pairs) == 0:
+            return []
+        a = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        b = np.array([pair[1] for pair in pairs], dtype=np.int64)
+        excluded = (self.levels[a] >= self.levels[b]) | np.any(
+            (self.low[:, b] < self.low[:, a]) | (self.post[:, b] > self.post[:, a]), axis=0)
+        result = a == b
+        for i in np.nonzero(~excluded & ~result)[0]:
+            result[i] = self._reachable(int(a[i]), int(b[i]))
+        return result.tolist()
+
+    def memory_usage(self):
+        """
+        This method return the memory used by the labels of the nodes.
+
+        :return: The size of the labels in bytes (type: int)
+        """
+        return self.levels.nbytes + self.low.nbytes + self.post.nbytes
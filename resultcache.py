@@ -0,0 +1,95 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+
+    """
+    Bounded cache of results, when it is full the least recently used result is evicted.
+
+    It counts the hits, the misses and the evictions, and it can be used by more threads.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        """
+        Result cache constructor
+
+        :param max_size: The maximum number of results in the cache, 0 means that nothing is cached, default is 1024 (type: int)
+
+        :raises ValueError: If max_size is less than 0
+        """
+        if max_size < 0:
+            raise ValueError("max_size must be at least 0")
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        This method return the result of a key and mark it as the most recently used.
+
+        :param key: The key of the result (type: hashable)
+
+        :return: The result, None if the key is not in the cache
+        """
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return self.results[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """
+        This method save the result of a key, evicting the least recently used results if the cache is full.
+
+        :param key: The key of the result (type: hashable)
+        :param result: The result, it must be not None
+        """
+        if self.max_size == 0:
+            return
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_size:
+                self.results.popitem(last=False)
+                self.evictions += 1
+
+    def memory_usage(self):
+        """
+        This method estimate the memory used by the keys and the results in the cache, with the elements of the tuples.
+
+        :return: The size in bytes (type: int)
+        """
+        def size(value):
+            if isinstance(value, tuple):
+                return sys.getsizeof(value) + sum(size(item) for item in value)
+            return sys.getsizeof(value)
+
+        with self.lock:
+            return sys.getsizeof(self.results) + \
+                sum(size(key) + size(result) for key, result in self.results.items())
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+    def stats(self):
+        """
+        This method return the statistics of the cache.
+
+        :return: The number of hits, misses, evictions, results in the cache and the maximum number of results (type: dict)
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.results),
+                "max_size": self.max_size
+            }
@@ -0,0 +1,218 @@
+import multiprocessing
+import threading
+import zlib
+from collections.abc import Mapping
+
+from bloomfilter import BloomFilter
+
+
+def shard_of(kmer: str, n_shards: int):
+    """
+    This function return the shard of a k-mer, from a hash of the k-mer that is the same in every process.
+
+    :param kmer: The k-mer (type: str)
+    :param n_shards: The number of shards (type: int)
+
+    :return: The index of the shard (type: int)
+    """
+    return zlib.crc32(kmer.encode()) % n_shards
+
+
+def _serve_shard(connection, canonical: bool):
+    """
+    This function is the loop of a shard process, it build and serve the hash-table of the k-mers of the shard.
+
+    A k-mer belongs to a single shard, so the shard can find alone if a k-mer starts in one node only.
+    """
+    helper_dict = {}
+    hashtable = {}
+    while True:
+        command, payload = connection.recv()
+        if command == "add":
+            for node, kmer, colors, strand in payload:
+                nodes = helper_dict.setdefault(kmer, {})
+                # the k-mers that start in more nodes are discarded
+                if nodes is None:
+                    continue
+                if node not in nodes and len(nodes) > 0:
+                    helper_dict[kmer] = None
+                    continue
+                nodes.setdefault(node, (strand, []))[1].extend(colors)
+        elif command == "finalize":
+            hashtable = {}
+            for kmer, nodes in helper_dict.items():
+                if nodes is not None:
+                    node, (strand, colors) = nodes.popitem()
+                    hashtable[kmer] = (node, colors, strand) if canonical else (node, colors)
+            helper_dict = {}
+            connection.send(len(hashtable))
+        elif command == "get":
+            connection.send([hashtable.get(kmer) for kmer in payload])
+        elif command == "items":
+            connection.send(list(hashtable.items()))
+        elif command == "bloom":
+            capacity, error_rate = payload
+            bloom_filter = BloomFilter(capacity, error_rate)
+            for kmer in hashtable:
+                bloom_filter.add(kmer)
+            connection.send(bloom_filter)
+        elif command == "close":
+            connection.close()
+            return
+
+
+class ShardedHashtable(Mapping):
+
+    """
+    Hash-table of k-mers split in shards, each shard is built and served by its own process.
+
+    The k-mers are assigned to the shards by a hash of the k-mer, the lookups of many k-mers are split across the shards and the values are merged in the order of the k-mers.
+    It is a read-only mapping with the same keys and values of the hash-table of AlignmentFreeGraph.
+    A shard answers one request at a time on its pipe, so every request holds the lock of its shard until the reply is received and it can be used by more threads.
+    """
+
+    def __init__(self, n_shards: int, canonical: bool = False, batch_size: int = 10000):
+        """
+        Sharded hash-table constructor, it starts a process for each shard.
+
+        :param n_shards: The number of shards (type: int)
+        :param canonical: If True the values have the strand of the k-mer as third element, default is False (type: bool)
+        :param batch_size: The number of k-mers sent to a shard at a time while the hash-table is built, default is 10000 (type: int)
+
+        :raises ValueError: If n_shards is less than 1
+        """
+        if n_shards < 1:
+            raise ValueError("n_shards must be greater than 0")
+        self.n_shards = n_shards
+        self.batch_size = batch_size
+        self.n_items = 0
+        self.connections = []
+        self.processes = []
+        self.locks = [threading.Lock() for _ in range(n_shards)]
+        for _ in range(n_shards):
+            connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve_shard, args=(child_connection, canonical), daemon=True)
+            process.start()
+            child_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def add(self, records):
+        """
+        This method send the k-mers to their shards.
+
+        :param records: The (start node, k-mer, colors, strand) tuples of the graph (type: iterable)
+        """
+        buffers = [[] for _ in range(self.n_shards)]
+        for record in records:
+            shard = shard_of(record[1], self.n_shards)
+            buffers[shard].append(record)
+            if len(buffers[shard]) >= self.batch_size:
+                with self.locks[shard]:
+                    self.connections[shard].send(("add", buffers[shard]))
+                buffers[shard] = []
+        for shard, buffer in enumerate(buffers):
+            if len(buffer) > 0:
+                with self.locks[shard]:
+                    self.connections[shard].send(("add", buffer))
+
+    def finalize(self):
+        """
+        This method keep, in every shard, only the k-mers that start in one node.
+
+        :return: The number of k-mers in the hash-table (type: int)
+        """
+        n_items = 0
+        for lock, connection in zip(self.locks, self.connections):
+            with lock:
+                connection.send(("finalize", None))
+                n_items += connection.recv()
+        self.n_items = n_items
+        return self.n_items
+
+    def get_many(self, kmers: list):
+        """
+        This method search many k-mers, the shards are queried at the same time.
+
+        The locks of the shards are taken in the order of the shards, so two threads never wait for each other.
+
+        :param kmers: The k-mers to search (type: list)
+
+        :return: The values of the k-mers, None for the k-mers that are not in the hash-table (type: list)
+        """
+        positions = [[] for _ in range(self.n_shards)]
+        for i, kmer in enumerate(kmers):
+            positions[shard_of(kmer, self.n_shards)].append(i)
+
+        shards = [shard for shard, shard_positions in enumerate(positions)
+                  if len(shard_positions) > 0]
+        for shard in shards:
+            self.locks[shard].acquire()
+        try:
+            for shard in shards:
+                self.connections[shard].send(
+                    ("get", [kmers[i] for i in positions[shard]]))
+
+            values = [None] * len(kmers)
+            for shard in shards:
+                for i, value in zip(positions[shard], self.connections[shard].recv()):
+                    values[i] = value
+        finally:
+            for shard in shards:
+                self.locks[shard].release()
+        return values
+
+    def bloom_filter(self, error_rate: float = 0.01):
+        """
+        This method compute the Bloom filter of the k-mers of the hash-table.
+
+        Every shard adds its k-mers to a filter with the capacity of the whole hash-table and only the filters are sent back and merged, so the k-mers are never copied out of the shards.
+
+        :param error_rate: The false positive rate of the filter, default is 0.01 (type: float)
+
+        :return: The Bloom filter (type: BloomFilter)
+        """
+        bloom_filter = BloomFilter(self.n_items, error_rate)
+        for lock, connection in zip(self.locks, self.connections):
+            with lock:
+                connection.send(("bloom", (self.n_items, error_rate)))
+                shard_filter = connection.recv()
+            bloom_filter.update(shard_filter)
+        return bloom_filter
+
+    def __getitem__(self, kmer: str):
+        value = self.get_many([kmer])[0]
+        if value is None:
+            raise KeyError(kmer)
+        return value
+
+    def __contains__(self, kmer: str):
+        return self.get_many([kmer])[0] is not None
+
+    def items(self):
+        for lock, connection in zip(self.locks, self.connections):
+            with lock:
+                connection.send(("items", None))
+                items = connection.recv()
+            yield from items
+
+    def __iter__(self):
+        for kmer, _ in self.items():
+            yield kmer
+
+    def __len__(self):
+        return self.n_items
+
+    def close(self):
+        """
+        This method stop the processes of the shards.
+        """
+        for lock, connection, process in zip(self.locks, self.connections, self.processes):
+            with lock:
+                if process.is_alive():
+                    connection.send(("close", None))
+                    process.join()
+                connection.close()
+        self.connections = []
+        self.processes = []